@@ -1,4 +1,4 @@
-from simulation import Simulation
-from simdex import Simdex, load_simdex
+from simulation import Simulation, probe
+from simdex import Simdex, load_simdex, convert_h5
 from result import Result
 from process import Process
\ No newline at end of file
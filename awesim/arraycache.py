@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded cache of arrays with least-recently-used eviction.
+
+A Simdex keeps the trajectories it read from its h5 file in an ArrayCache,
+keyed by (SID, variable), so that repeated get(), plot() and apply() calls
+on the same variables do not go back to the file.  In format 2, the offsets
+tables of the variables are cached as well.  The total size of the cached
+arrays is kept below a budget in bytes: when it is exceeded, the arrays
+that were used longest ago are dropped.
+
+The cache keeps the arrays it is given, without copying them.  A Simdex
+hands out copies of the cached arrays (or read-only views of constant
+trajectories), so that its callers cannot change the cache.  Copying or
+deepcopying the cache returns the cache itself, so that filtered simdexes
+share the cache of their parent.  A pickled cache is empty again when it
+is loaded.
+"""
+
+from collections import OrderedDict
+import numpy as np
+
+# size in bytes that is attributed to an entry without array (eg. None)
+ENTRY_BYTES = 64
+
+
+def _nbytes(value):
+    """Return the memory used by value, an array or None"""
+
+    if not isinstance(value, np.ndarray):
+        return ENTRY_BYTES
+    if 0 in value.strides and value.base is not None:
+        # a broadcast view only takes the memory of what it views
+        return min(value.nbytes, np.asarray(value.base).nbytes)
+    return value.nbytes
+
+
+class ArrayCache(object):
+    """
+    Cache of arrays with a maximum total size of maxbytes bytes.
+
+    Attributes:
+        - maxbytes: the budget, in bytes.  It is applied on the next put()
+        - nbytes: the size of all cached arrays, in bytes
+        - hits, misses: number of get() calls that found / did not find
+          their key
+        - evictions: number of entries dropped to stay within maxbytes
+
+    On purpose, copy.copy() and copy.deepcopy() return the cache itself
+    (__copy__, __deepcopy__), and a pickled cache is restored empty, with
+    the same maxbytes (__reduce__): the cached arrays are never duplicated.
+    """
+
+    def __init__(self, maxbytes=2**28):
+        self.maxbytes = maxbytes
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __eq__(self, other):
+        # the cached arrays are transient, only the budget counts
+        return isinstance(other, ArrayCache) and \
+            self.maxbytes == other.maxbytes
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        # the cached arrays are not pickled
+        return (ArrayCache, (self.maxbytes,))
+
+    def get(self, key, default=None):
+        """Return the value for key and mark it as recently used"""
+
+        try:
+            value, size = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries[key] = (value, size)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Add value (an array or None) for key, and drop the least recently
+        used entries if the cache is too large.
+
+        Arrays that are larger than maxbytes are not cached.
+        """
+
+        self.discard(key)
+        size = _nbytes(value)
+        if size > self.maxbytes:
+            return
+        self._entries[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.maxbytes:
+            oldest, (value, size) = self._entries.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+
+    def discard(self, key):
+        """Remove key from the cache, if it is there"""
+
+        try:
+            value, size = self._entries.pop(key)
+        except KeyError:
+            return
+        self.nbytes -= size
+
+    def discard_where(self, condition):
+        """Remove all keys for which condition(key) is True"""
+
+        for key in [k for k in self._entries if condition(k)]:
+            self.discard(key)
+
+    def clear(self):
+        """Remove all entries, the statistics are kept"""
+
+        self._entries.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        """
+        Return a dictionary with the statistics of the cache: hits, misses,
+        hit_ratio, evictions, entries, nbytes and maxbytes
+        """
+
+        calls = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / float(calls) if calls else 0.,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'nbytes': self.nbytes,
+                'maxbytes': self.maxbytes}
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Low-level reader for MAT v4 files, the format of Dymola result files.
+
+Only the matrix headers are parsed when a file is opened.  The matrices
+themselves are read on request, either into memory (read_matrix) or as a
+read-only memory map (memmap_matrix).  The latter is used for data_2, the
+matrix with all trajectories, so that only the columns that are really used
+are ever read from disk.
+
+The orientation of the returned arrays is identical to the orientation
+of the arrays returned by scipy.io.loadmat: shape = (mrows, ncols)
+
+A MAT v4 file is a sequence of matrices, each preceded by a header of 5
+integers:
+    - type: MOPT, M = byte order, O = 0, P = precision, T = matrix type
+    - mrows, ncols: shape of the matrix
+    - imagf: 1 if the matrix has an imaginary part
+    - namlen: length of the name, including the terminating \\x00
+
+The data itself is stored column by column.
+"""
+
+import os
+import numpy as np
+
+# precision digit P of the MOPT type
+PRECISIONS = {0: 'f8', 1: 'f4', 2: 'i4', 3: 'i2', 4: 'u2', 5: 'u1'}
+# byte order digit M of the MOPT type
+BYTE_ORDERS = {0: '<', 1: '>'}
+
+
+class MatrixHeader(object):
+    """
+    Header of a single matrix in a MAT v4 file.
+
+    Attributes:
+        - name: the name of the matrix (string)
+        - dtype: numpy dtype of the stored values
+        - mrows, ncols: shape of the stored matrix
+        - text: True if the matrix is a text matrix
+        - offset: position of the first data byte in the file
+    """
+
+    def __init__(self, name, dtype, mrows, ncols, text, offset):
+        self.name = name
+        self.dtype = dtype
+        self.mrows = mrows
+        self.ncols = ncols
+        self.text = text
+        self.offset = offset
+
+    @property
+    def nbytes(self):
+        """Number of bytes of the data of this matrix in the file"""
+        return self.mrows * self.ncols * self.dtype.itemsize
+
+    def __repr__(self):
+        return 'MatrixHeader(%s, %s, (%d, %d))' % (self.name, self.dtype,
+                                                   self.mrows, self.ncols)
+
+
+def _parse_header(f, size):
+    """
+    Return the MatrixHeader starting at the current position of f.
+
+    Return None at the end of the file.  Raise IOError if the bytes found
+    cannot be a MAT v4 header or if the matrix does not fit in the file.
+    """
+
+    raw = f.read(20)
+    if len(raw) == 0:
+        return None
+    if len(raw) < 20:
+        raise IOError('Truncated MAT v4 header in %s' % (f.name))
+
+    # the byte order of the header is the byte order of the file, but we
+    # can only know it after trying
+    for bo in ['<', '>']:
+        mopt, mrows, ncols, imagf, namlen = np.frombuffer(raw, dtype=bo+'i4')
+        if 0 <= mopt < 2000 and BYTE_ORDERS[mopt // 1000] == bo:
+            break
+    else:
+        raise IOError('%s is no MAT v4 file' % (f.name))
+
+    precision = (mopt // 10) % 10
+    if (mopt // 100) % 10 != 0 or not PRECISIONS.has_key(precision) \
+        or mopt % 10 > 1 or imagf != 0 or mrows < 0 or ncols < 0 \
+        or not 0 < namlen < 256:
+        raise IOError('Unsupported or invalid MAT v4 matrix in %s' % (f.name))
+
+    name = f.read(namlen).rstrip('\x00')
+    header = MatrixHeader(name, np.dtype(bo + PRECISIONS[precision]),
+                          int(mrows), int(ncols), mopt % 10 == 1, f.tell())
+    if header.offset + header.nbytes > size:
+        raise IOError('Matrix %s is truncated in %s' % (name, f.name))
+    return header
+
+
+def read_headers(f):
+    """
+    Return a dictionary with name:MatrixHeader pairs for all matrices in f.
+
+    f is a file object, opened in binary mode.  Only the headers are read,
+    the data of the matrices is skipped.
+    """
+
+    size = os.fstat(f.fileno()).st_size
+    headers = {}
+    f.seek(0)
+    while True:
+        header = _parse_header(f, size)
+        if header is None:
+            break
+        headers[header.name] = header
+        f.seek(header.offset + header.nbytes)
+
+    return headers
+
+
+def read_matrix(f, header):
+    """Read the matrix described by header from file object f into memory"""
+
+    f.seek(header.offset)
+    data = np.fromfile(f, dtype=header.dtype, count=header.mrows*header.ncols)
+    matrix = data.reshape((header.mrows, header.ncols), order='F')
+    if header.text:
+        matrix = matrix.astype(np.uint8).view('S1')
+    return matrix
+
+
+def memmap_matrix(filename, header):
+    """
+    Return a read-only memory map of the matrix described by header.
+
+    Nothing is read from disk until values of the matrix are used.
+    """
+
+    if header.mrows * header.ncols == 0:
+        return np.zeros((header.mrows, header.ncols), dtype=header.dtype)
+    return np.memmap(filename, dtype=header.dtype, mode='r',
+                     offset=header.offset,
+                     shape=(header.mrows, header.ncols), order='F')
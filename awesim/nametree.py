@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Prefix tree of the dotted names of a Modelica model.
+
+A name like 'c[1].heatPort.Q_flow' is split in its components 'c[1]',
+'heatPort' and 'Q_flow'.  Dots between brackets or parentheses do not
+split a name, also when they are nested, so 'der(c1.T)' and 
+'der(a.b[1].c)' are single components.
+
+The tree is used for fast listing of the children of a model and for
+wildcard queries on the hierarchy.  The results of the last SEARCHES 
+regular expression searches over all names are cached, because the same 
+searches are typically repeated during interactive exploration.
+"""
+
+import re
+import fnmatch
+from collections import OrderedDict
+
+# key in a node of the tree that marks a full name
+LEAF = None
+# number of regular expression searches that are cached by a NameTree
+SEARCHES = 100
+# characters with a special meaning in a regular expression
+_SPECIAL = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+
+def split_name(name):
+    """
+    Return the list of components of a dotted Modelica name.  Dots inside
+    (nested) brackets or parentheses do not split the name.
+    """
+    
+    if '[' not in name and '(' not in name:
+        return name.split('.')
+    components = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(name):
+        if char in '[(':
+            depth += 1
+        elif char in '])':
+            depth -= 1
+        elif char == '.' and depth == 0:
+            components.append(name[start:i])
+            start = i + 1
+    components.append(name[start:])
+    return components
+
+
+class NameTree(object):
+    """
+    Prefix tree of a list of dotted names.
+
+    Each node is a dictionary with component:node pairs.  If the path to a
+    node is a name, the node has the key LEAF with the full name as value.
+    """
+
+    def __init__(self, names):
+        self.names = names
+        self.root = {}
+        # regex:matches of the last SEARCHES searches, most recent last
+        self._searches = OrderedDict()
+        # the names in lower case, for searches without special characters
+        self._lower = None
+        for name in names:
+            node = self.root
+            for component in split_name(name):
+                try:
+                    node = node[component]
+                except KeyError:
+                    node[component] = {}
+                    node = node[component]
+            node[LEAF] = name
+
+    def _node(self, path):
+        """
+        Return the node for path (a dotted name), or None if it does not exist
+
+        The exact path is tried first.  If it does not exist, components are
+        looked up case insensitive.
+        """
+
+        node = self.root
+        if path == '':
+            return node
+        for component in split_name(path):
+            if node.has_key(component):
+                node = node[component]
+                continue
+            lower = component.lower()
+            matches = [c for c in node if c is not LEAF and c.lower() == lower]
+            if len(matches) == 0:
+                return None
+            node = node[matches[0]]
+        return node
+
+    def exists(self, path):
+        """Return True if path is a node of the tree (see _node)"""
+
+        return self._node(path) is not None
+
+    def children(self, path=''):
+        """
+        Return a sorted list with the components directly below path.
+
+        path = '' gives the top level objects.  An empty list is returned if
+        path does not exist.
+        """
+
+        node = self._node(path)
+        if node is None:
+            return []
+        return sorted([c for c in node if c is not LEAF])
+
+    def below(self, path=''):
+        """Return a list with all names below (and including) path"""
+
+        node = self._node(path)
+        if node is None:
+            return []
+        result = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for component, child in node.iteritems():
+                if component is LEAF:
+                    result.append(child)
+                else:
+                    stack.append(child)
+        return result
+
+    def find(self, pattern):
+        """
+        Return a list with all names matching pattern.
+
+        pattern is a dotted name in which each component can contain the
+        shell-style wildcards *, ? and [seq] (see fnmatch), eg.
+        'c*.heatPort.*'.  A component '**' matches any number of levels.
+        Note that brackets of array indices have to be escaped as [[] and
+        []] when wildcards are used in that component, eg. 'c[[]*[]].T'.
+        """
+
+        components = split_name(pattern)
+        result = []
+        stack = [(self.root, 0)]
+        while stack:
+            node, level = stack.pop()
+            if level == len(components):
+                if node.has_key(LEAF):
+                    result.append(node[LEAF])
+                continue
+            component = components[level]
+            if component == '**':
+                # zero levels, or one level and stay at this component
+                stack.append((node, level + 1))
+                for c, child in node.iteritems():
+                    if c is not LEAF:
+                        stack.append((child, level))
+            elif node.has_key(component):
+                stack.append((node[component], level + 1))
+            else:
+                for c, child in node.iteritems():
+                    if c is not LEAF and fnmatch.fnmatchcase(c, component):
+                        stack.append((child, level + 1))
+        # '**' can find the same name more than once
+        return sorted(set(result))
+
+    def search(self, regex):
+        """
+        Return a list with all names for which re.search(regex) matches,
+        not case sensitive.  
+
+        A regex without special characters is looked up as a substring of
+        the names in lower case.  The results of the last SEARCHES regexes
+        are cached.
+        """
+
+        try:
+            matches = self._searches.pop(regex)
+        except KeyError:
+            if _SPECIAL.search(regex) is None:
+                if self._lower is None:
+                    self._lower = [name.lower() for name in self.names]
+                lower = regex.lower()
+                matches = [name for name, l in zip(self.names, self._lower)
+                           if lower in l]
+            else:
+                p = re.compile(regex, re.IGNORECASE)
+                matches = [name for name in self.names if p.search(name)]
+            if len(self._searches) >= SEARCHES:
+                self._searches.popitem(last=False)
+        self._searches[regex] = matches
+        return list(matches)
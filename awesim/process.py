@@ -16,7 +16,213 @@ import copy
 #import tables as tbl
 #from datetime import datetime, timedelta
 #import pandas
+import re
+import ast
+import numbers
+import numpy as np
 import pdb
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+# a valid python name, only these can be the result of a mother substitution
+IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*$')
+
+# Element-wise expressions can be evaluated by numexpr (engine='numexpr').
+# These are the operators and (numpy) functions that numexpr supports.
+NUMEXPR_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod, 
+                     ast.BitAnd, ast.BitOr, ast.Invert, ast.USub, ast.UAdd,
+                     ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+NUMEXPR_FUNCTIONS = set(['sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 
+                         'arctan2', 'sinh', 'cosh', 'tanh', 'arcsinh', 
+                         'arccosh', 'arctanh', 'log', 'log10', 'log1p', 'exp',
+                         'expm1', 'sqrt', 'abs', 'where'])
+# numexpr is only used if one of the arrays has at least this size, for 
+# small arrays eval is faster
+NUMEXPR_MIN_SIZE = 4096
+
+
+def _numexpr_names(node):
+    """
+    Return the set of names used in the expression tree node if numexpr can
+    evaluate it (element-wise operations only), otherwise return None.
+    """
+    
+    if isinstance(node, ast.Expression):
+        return _numexpr_names(node.body)
+    elif isinstance(node, ast.Name):
+        return set([node.id])
+    elif isinstance(node, ast.Num):
+        return set() if not isinstance(node.n, complex) else None
+    elif isinstance(node, ast.BinOp):
+        if not isinstance(node.op, NUMEXPR_OPERATORS):
+            return None
+        left, right = _numexpr_names(node.left), _numexpr_names(node.right)
+        if left is None or right is None:
+            return None
+        return left | right
+    elif isinstance(node, ast.UnaryOp):
+        if not isinstance(node.op, NUMEXPR_OPERATORS):
+            return None
+        return _numexpr_names(node.operand)
+    elif isinstance(node, ast.Compare):
+        # no chained comparisons like 0 < a < 1
+        if len(node.ops) != 1 or not isinstance(node.ops[0], NUMEXPR_OPERATORS):
+            return None
+        left = _numexpr_names(node.left)
+        right = _numexpr_names(node.comparators[0])
+        if left is None or right is None:
+            return None
+        return left | right
+    elif isinstance(node, ast.Call):
+        func = node.func
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) \
+            and func.value.id in ('np', 'numpy'):
+            func_name = func.attr
+        elif isinstance(func, ast.Name):
+            func_name = func.id
+        else:
+            return None
+        if func_name not in NUMEXPR_FUNCTIONS or node.keywords or \
+            node.starargs or node.kwargs:
+            return None
+        names = set()
+        for arg in node.args:
+            arg_names = _numexpr_names(arg)
+            if arg_names is None:
+                return None
+            names |= arg_names
+        return names
+    else:
+        # subscripts, attributes, and/or, lambda, ...
+        return None
+
+
+class PPLine(object):
+    """
+    A single post-processing string, parsed and compiled once.
+    
+    The string is split on spaces like described in Process.__init__: the 
+    first item is the name of the new variable, the items after the '=' 
+    form the expression.  
+    
+    If the line has to be evaluated for each mother, the names of the new 
+    variable and the candidate substitutions (token position, mother_token) 
+    are determined here for each mother.  Which substitutions are really made
+    depends on the names present in a simulation, so the code objects are 
+    compiled and cached for each set of substitutions (see get_code).
+    
+    Attributes:
+        - string: the original pp string
+        - target: the name of the new variable
+        - tokens: the items of the expression
+        - on_mothers: True if the line has to be evaluated for each mother
+        - mothers: list with (new variable, candidates) pairs, one per mother
+        - names: set with the names used by the expression itself
+        - dependencies: set with all names this line can use, including
+          the mother_token names
+        - numexpr_names: set with the names used in the expression if it is
+          element-wise and can be evaluated by numexpr, None otherwise
+    """
+    
+    def __init__(self, string, mothers, subs):
+        """
+        Parse string.  mothers is the list of mothers of the process, subs 
+        is a set with the short names that have to be applied on the mothers
+        """
+        
+        splitted = string.split(' ')
+        self.string = string
+        self.target = splitted[0]
+        self.tokens = splitted[2:]
+        self.on_mothers = False
+        for token in self.tokens:
+            if token in subs:
+                self.on_mothers = True
+                break
+        
+        self._codes = {}
+        self.names = set(self.get_code().co_names)
+        self.dependencies = set(self.names)
+        self.numexpr_names = _numexpr_names(
+            ast.parse(self.expression().strip(), mode='eval'))
+        self.mothers = []
+        if self.on_mothers:
+            for m in mothers:
+                newvar = '_'.join([m, self.target]).replace('.', '_')
+                candidates = []
+                for i, token in enumerate(self.tokens):
+                    fullname = '_'.join([m, token]).replace('.', '_')
+                    if IDENTIFIER.match(fullname):
+                        candidates.append((i, fullname))
+                        self.dependencies.add(fullname)
+                self.mothers.append((newvar, tuple(candidates)))
+    
+    def __getstate__(self):
+        """Code objects cannot be pickled, they are compiled again if needed"""
+        
+        state = self.__dict__.copy()
+        state['_codes'] = {}
+        return state
+    
+    def expression(self, substitutions=()):
+        """Return the expression, with (position, name) substitutions"""
+        
+        tokens = list(self.tokens)
+        for i, fullname in substitutions:
+            tokens[i] = fullname
+        return ' '.join(tokens)
+    
+    def get_code(self, substitutions=()):
+        """Return the (cached) code object of the expression"""
+        
+        try:
+            return self._codes[substitutions]
+        except KeyError:
+            # like eval(), ignore the leading spaces 
+            code = compile(self.expression(substitutions).strip(), 
+                           self.string, 'eval')
+            self._codes[substitutions] = code
+            return code
+    
+    def evaluate(self, namespace, globals_, substitutions=(), engine='python'):
+        """
+        Return the value of the expression, with namespace as locals.
+        
+        If engine is 'numexpr', numexpr is installed and the expression is 
+        element-wise on large enough arrays, numexpr evaluates it (multi-
+        threaded and without temporary arrays).  In all other cases, and if 
+        numexpr fails, the code object is evaluated with eval().
+        """
+        
+        if engine == 'numexpr' and numexpr is not None and \
+            self.numexpr_names is not None:
+            renamed = dict(substitutions)
+            local_dict = {}
+            large = False
+            for i, token in enumerate(self.tokens):
+                name = renamed.get(i, token)
+                if token in self.numexpr_names and namespace.has_key(name):
+                    value = namespace[name]
+                    if isinstance(value, np.ndarray) and value.dtype.kind in 'biuf':
+                        large = large or value.size >= NUMEXPR_MIN_SIZE
+                    elif not isinstance(value, numbers.Real):
+                        large = False
+                        break
+                    local_dict[name] = value
+            # names inside tokens like 'np.sqrt(T)' or not found: use eval 
+            if large and len(local_dict) == len(self.numexpr_names):
+                expression = re.sub(r'\b(np|numpy)\.', '', 
+                                    self.expression(substitutions).strip())
+                try:
+                    return numexpr.evaluate(expression, local_dict=local_dict,
+                                            global_dict={})
+                except Exception:
+                    pass
+        
+        return eval(self.get_code(substitutions), globals_, namespace)
+
 
 class Process(object):
     """
@@ -30,7 +236,8 @@ class Process(object):
     """
     
     def __init__(self, mothers=None, parameters=None, sub_pars=None, variables=None,
-                 sub_vars=None, pp=None, integrate=None):
+                 sub_vars=None, pp=None, integrate=None, engine='python',
+                 outputs=None):
         """Instantiate the Process object
         
         parameters
@@ -67,9 +274,25 @@ class Process(object):
           Example: mothers = ['c1', c2'], sub_vars = {'Q':'Q_flow'}, 
           integrate = {'Q':1e-6} will create c1_Q_Int and c2_Q_Int.
           
+        - engine: 'python' (default) or 'numexpr'.  With 'numexpr', the 
+          element-wise pp strings (arithmetic, comparisons and functions like 
+          np.sqrt or np.where) are evaluated by numexpr if it is installed.  
+          All other strings are still evaluated by python.  Note that numexpr
+          computes float32 variables in double precision.
+        - outputs: list with the short names that have to be kept after the
+          post-processing (Time is always kept).  Only the variables, 
+          parameters and pp strings needed for these outputs are extracted 
+          and evaluated, see get_requirements().  If None (default), 
+          everything is kept.
+          
         """
         #pdb.set_trace()
         pp_int = []
+        
+        if engine == 'numexpr' and numexpr is None:
+            print 'numexpr is not installed, the pp strings are evaluated by python'
+        self.engine = engine
+        self.outputs = outputs
                
         # make/complete the variables and parameter dicts, full paths
         if variables is None:
@@ -142,6 +365,68 @@ class Process(object):
             
         
         
+    def get_plan(self):
+        """
+        Return the post-processing plan: a list of PPLine objects for self.pp
+        
+        The plan is made once and cached on the Process, so it can be reused
+        for all simulations.  It is made again if self.pp or self.mothers 
+        change.  The targets of lines that are applied on the mothers are 
+        added to self.sub_vars, so they can be used in the next lines.
+        """
+        
+        key = (tuple(self.pp), tuple(self.mothers))
+        if getattr(self, '_plan_key', None) != key:
+            subs = set(self.sub_vars)
+            subs.update(self.sub_pars)
+            plan = []
+            for string in self.pp:
+                line = PPLine(string, self.mothers, subs)
+                if line.on_mothers:
+                    # To ensure that the newly created var can be used later on
+                    subs.add(line.target)
+                    self.sub_vars[line.target] = line.target
+                plan.append(line)
+            self._plan = plan
+            self._plan_key = key
+        return self._plan
+    
+    def get_requirements(self, outputs):
+        """
+        Return (names, steps) needed to compute the short names in outputs
+        
+        - names: set with the short names of the variables and parameters 
+          that have to be extracted
+        - steps: list with (PPLine, mothers) pairs that have to be evaluated,
+          in the order of self.pp.  mothers is the list with the 
+          (new variable, candidates) pairs that are needed from line.mothers.
+          
+        The pp lines are walked backwards, starting from the outputs, so 
+        only what is reachable from the outputs is retained.
+        """
+        
+        needed = set(outputs)
+        steps = []
+        for line in reversed(self.get_plan()):
+            if line.on_mothers:
+                mothers = [(newvar, candidates) for newvar, candidates in 
+                           line.mothers if newvar in needed]
+                required = len(mothers) > 0
+                for newvar, candidates in mothers:
+                    needed.update([fullname for i, fullname in candidates])
+            else:
+                mothers = []
+                required = line.target in needed
+            if required:
+                needed.update(line.names)
+                steps.append((line, mothers))
+        steps.reverse()
+        
+        names = set(self.variables)
+        names.update(self.parameters)
+        return names & needed, steps
+    
+        
     def __str__(self):
         """Return a print string"""
         
@@ -59,18 +59,23 @@ Most important methods (* = implemented):
 
 import numpy as np
 import os
+import hashlib
 #import scipy.io
 import re
 import copy
+import itertools
 import matplotlib.pyplot as plt
 #from matplotlib.dates import date2num
 import cPickle as pickle
-import bisect
 import tables as tbl
 #from datetime import datetime, timedelta
-#import pandas
+import pandas as pd
+from multiprocessing import Pool
 import pdb
-from .simulation import Simulation
+from .simulation import Simulation, probe
+from .utilities import use_pool
+from .nametree import NameTree
+from .arraycache import ArrayCache
 from .result import Result
 from .pymosim import analyse_log
 
@@ -87,6 +92,17 @@ class Simdex:
     in the attributes of the simdex object. When a filter is applied to a
     simdex, the resulting subset of simulations uses the same h5 file, so 
     there is no unnecessary copying of big files on the hard drive.
+    
+    There are two layouts of the h5 file, marked by the attribute 
+    format_version of its root:
+        - 1: a group per simulation (/SIDxxxx) with an array per variable
+        - 2: a group per variable (/variables/name) with a compressed, 
+          extendable array 'values' with the trajectories of all 
+          simulations one after the other, and a table 'offsets' with the 
+          position of each simulation in it.  Getting a variable for all 
+          simulations is a single read.  See convert_h5() to convert an 
+          h5 file to this layout.  The values of removed simulations stay
+          in the file until it is converted again.
         
     Overview of most important attributes :
         - self.simulations: a list with unique ID's (SID) of the simulations
@@ -100,6 +116,15 @@ class Simdex:
           The variables are listed here with their FULL names.
         - self.variablemap: numpy array mapping which simulation has 
           which variables
+          
+        Most simulations in a set share the same parameter and variable 
+        names.  Therefore, each distinct set of names (a structure) is only
+        stored once, as a boolean column of self._parstructures or 
+        self._varstructures.  self._parids and self._varids contain the
+        structure id of each simulation.  parametermap and variablemap are 
+        computed from these when they are asked for, and kept until the 
+        simdex uses its structures again (see _sync_maps), so changes in 
+        place are taken into account.
         - self.filterset: dictionary tracking all executed filter options on 
           the current set
         - self.vardic (optional): a mapping of shortname:longname pairs for 
@@ -111,6 +136,9 @@ class Simdex:
         - self.identifiers: optional dictionary with short meaningful identifiers
           for the simulations.  Is used as legend in plots by default (unless 
           empty).
+        - self.cache: ArrayCache with the trajectories read from the h5 file,
+          shared with the simdexes made by filters.  See cache.stats() for 
+          the hits and misses.
           
         
     Most important methods (* = implemented):
@@ -159,7 +187,8 @@ class Simdex:
 
     """
     
-    def __init__(self, folder='', h5='simdex.h5', process=None, verbose = False):
+    def __init__(self, folder='', h5='simdex.h5', process=None, verbose = False,
+                 format_version=1, cache_bytes=2**28):
         '''
         Create a Simdex object.  
         
@@ -167,7 +196,14 @@ class Simdex:
         If folder = '', no work directory is indexed.
         
         h5 is the hdf5 file to which this simdex will be linked.
+        format_version is the layout of the h5 file, 1 (a group per 
+        simulation) or 2 (a group per variable), see the Simdex docstring.
+        cache_bytes is the memory budget of the cache of trajectories read 
+        from the h5 file (self.cache), 0 to disable it.
         '''
+        
+        if format_version not in FORMAT_VERSIONS:
+            raise ValueError('Unknown format_version %s' % format_version)
         # First, initialise some  attributes
         if verbose == True:
             self.verbose = True
@@ -179,6 +215,13 @@ class Simdex:
         self.simulations = []
         # dictionary with SIDx:path pairs (path are full pathnames)        
         self.files = {}
+        # dictionary with SIDx:(size, mtime, md5) of the indexed files, 
+        # see scan()
+        self.signatures = {}
+        # simulations that are not yet in the maps, see merge_pending()
+        self._pending = []
+        # (SID, h5 name):array pairs, see _get_vars_h5()
+        self.cache = ArrayCache(cache_bytes)
         self.identifiers = {}
         # used for plotting
         self.year = 2010
@@ -198,6 +241,7 @@ class Simdex:
             
         if overwrite == 'y' or overwrite == 'Y':
             self.h5 = tbl.openFile(self.h5_path, 'w', title='Simdex file')
+            self.h5.root._v_attrs.format_version = format_version
             self.h5.close()
         else:
             raise NotImplementedError("Remove the file first !")
@@ -208,9 +252,9 @@ class Simdex:
             # an empty simdex is created
             self.parameters = []
             self.variables = []
-            self.parametermap = np.ndarray((0, 1))
-            self.parametervalues = copy.copy(self.parametermap)
-            self.variablemap = np.ndarray((0, 1))
+            self.parametermap = np.zeros((0, 0))
+            self.parametervalues = np.zeros((0, 0))
+            self.variablemap = np.zeros((0, 0))
             
         
         # here we get a list with all files in 'folder' that end with .mat
@@ -223,6 +267,58 @@ class Simdex:
         if self.h5.isopen:
             self.h5.close()
 
+    def __getattr__(self, name):
+        """
+        Compute parametermap and variablemap from the structures: an array 
+        with a row per parameter (variable) and a column per simulation, 1 
+        if the simulation has the parameter (variable), 0 otherwise.
+        """
+        
+        if not _MAPS.has_key(name):
+            raise AttributeError(name)
+        structures, ids = _MAPS[name]
+        value = self.__dict__[structures][:, self.__dict__[ids]].astype(float)
+        self.__dict__[name] = value
+        return value
+    
+    def __setattr__(self, name, value):
+        """Assigning parametermap or variablemap interns its columns"""
+        
+        if _MAPS.has_key(name):
+            self.__dict__.pop(name, None)
+            structures, ids = _MAPS[name]
+            self.__dict__[structures], self.__dict__[ids] = _intern(value)
+        else:
+            if _MAP_OF.has_key(name):
+                # the map does not match the new structures anymore
+                self.__dict__.pop(_MAP_OF[name], None)
+            self.__dict__[name] = value
+    
+    def __setstate__(self, state):
+        """Restore a pickled simdex, also one saved by an older version"""
+        
+        self.__dict__.update(state)
+        # the dense maps of older versions become structures
+        self._sync_maps()
+        # saved before the files were checked on rescan
+        if not self.__dict__.has_key('signatures'):
+            self.signatures = {}
+        if not self.__dict__.has_key('_pending'):
+            self._pending = []
+        if not self.__dict__.has_key('cache'):
+            self.cache = ArrayCache()
+    
+    def _sync_maps(self):
+        """
+        Intern parametermap and variablemap again if they were asked for: 
+        they may have been changed in place.  Methods that use the 
+        structures call this first.
+        """
+        
+        for name in _MAPS:
+            if self.__dict__.has_key(name):
+                setattr(self, name, self.__dict__[name])
+
     def openh5(self):
         """Open the h5 file in append mode"""
         try:
@@ -269,7 +365,8 @@ class Simdex:
             
         return s
                     
-    def scan(self, folder='', process=None, timecheck=True):
+    def scan(self, folder='', process=None, timecheck=True, grid=None,
+             workers=1, checksum=False):
         """
         Scan a folder for .mat files and add them to the simdex
         
@@ -277,9 +374,30 @@ class Simdex:
         ----------
         - folder: a single folder to be sought for .mat files
           If folder == '', the current work directory is indexed
-        - process: a post-processing to be applied to each mat file
+        - process: a post-processing to be applied to each mat file.  Only
+          the variables in process.variables are read from the mat files.
         - timecheck: if True, verify that all indexed simulations have the 
-          same start and stop times.  
+          same start and stop times.  This also holds when files are added 
+          to a simdex that already has simulations: with timecheck=False, 
+          they are added whatever their start and stop times.
+        - grid: array with time instants (optional).  If given, all
+          trajectories are resampled to this grid before they are stored
+          in the h5 file, respecting the interpolation and extrapolation
+          settings of each variable in the result files.  This makes the
+          stored trajectories of simulations with different output
+          intervals or events directly comparable.
+        - workers: number of worker processes.  If workers > 1, the files 
+          are loaded and post-processed in a process pool, the largest 
+          files first.  The simdex and the h5 file are only updated by the 
+          calling process, in the order of the sorted filenames, so the 
+          SIDs are the same for any number of workers.
+        - checksum: if True, the md5 checksum of each file is stored too.
+        
+        Files that are already in the simdex are not loaded again if their
+        size and modification time did not change (or, with checksum, if 
+        their content did not change).  A changed file is indexed again, 
+        under a new SID.  Its old SID is only removed if the new version 
+        could be indexed.
         
         """
         
@@ -288,6 +406,20 @@ class Simdex:
         if process is None:
             process = self.process
         
+        # with a process, only the variables it needs are loaded.  The plan 
+        # is made here, so that it is pickled with the process for the 
+        # workers, and the targets on the mothers are in process.sub_vars
+        if process is not None:
+            process.get_plan()
+        if process is None:
+            variables = None
+        elif getattr(process, 'outputs', None) is None:
+            variables = process.variables.values()
+        else:
+            names, steps = process.get_requirements(process.outputs)
+            variables = [process.variables[n] for n in names 
+                         if process.variables.has_key(n)]
+        
         if folder == '' :
             folder = os.getcwd()
         
@@ -299,114 +431,107 @@ class Simdex:
         if len(filenames) == 0:
             raise ValueError("No .mat files found in %s" % (folder))
         
-        # Convert to full path filenames to avoid confusion
+        # Convert to full path filenames to avoid confusion.  The files are 
+        # sorted, so the SIDs do not depend on the order of os.listdir()
         full_path_filenames = []
         for i in range(len(filenames)):
             full_path_filenames.append(os.path.join(folder,filenames[i]))
-        
-        # run the following loop only when this is the first time files are
-        # being indexed
-        if self.simulations == []:
-            # index is the pointer to the current file in full_path_filenames
-            index = -1
-            ########################################################################
-            # Now we take the first .mat file and use this as a basis for our index
-            first_file_indexed = False
-            while first_file_indexed == False:
-                index += 1
-                simulation_file = False
-                try:
-                    # We try the .mat files one by one until 
-                    # we find a first Dymola file
-                    sim = Simulation(full_path_filenames[index])
-                    simulation_file = True
-                except MemoryError:
-                    print 'WARNING: %s could not be indexed because of a MemoryError.\nThe file is probably too big.  It could help to try in a fresh python instance' % (full_path_filenames[index])
-                except:
-                    print '%s is no Dymola file.  It is not indexed' % \
-                        (full_path_filenames[index])
-    
-                if simulation_file:                
-                    # Now, check the simulation runtime and confirm with user that it is 
-                    # correct.  For the next simulation files, the runtime will be compared
-                    # to this one to decide if the file is ok or not. 
-                    time = sim.get_value('Time')
-                    
-                    print 'The first found simulation, %s, runs from %d s till %d s' % \
-                        (sim.filename, time[0],time[-1])
-                    #timeOK = raw_input('Is this correct? y/n : ')
-                    timeOK = 'y'
-                    print '\n'
-                    if timeOK == 'y' or timeOK == 'Y':
-                        self.simulationstart = time[0]
-                        self.simulationstop = time[-1]
-                        first_file_indexed = True
-                    else:
-                        print '%s is NOT indexed' % (sim.filename)
-                
-
-            # The first simulation file is indexed and the attributes are 
-            # initialised.  
-            self.index_one_sim(sim, process=process)
-            print '%s indexed' % (sim.filename)
-            ########################################################################
-            # The next step is to index all remaining files
+        full_path_filenames.sort()
+        
+        # SIDs of the files that are already indexed
+        indexed = dict([(path, sid) for sid, path in self.files.items()])
+        # path:SID of changed files, removed once the new version is indexed
+        replaced = {}
+        unchanged = 0
+        # (index, filename, variables, process, grid) for _summarize_file
+        jobs = []
+        # summary of the first file of a new simdex, loaded to check it
+        first_summary = None
+        signatures = {}
+        for filename in full_path_filenames:
+            signature = _signature(filename)
+            sid = indexed.get(os.path.abspath(filename))
+            if sid is not None:
+                old = self.signatures.get(sid)
+                if old is not None and old[:2] == signature[:2]:
+                    unchanged += 1
+                    continue
+                if checksum and old is not None and old[0] == signature[0] \
+                    and old[2] == _signature(filename, True)[2]:
+                    # only touched, keep the new modification time
+                    self.signatures[sid] = old[:1] + signature[1:2] + old[2:]
+                    unchanged += 1
+                    continue
+                print '%s has changed, it is indexed again' % (filename)
+                replaced[os.path.abspath(filename)] = sid
             
-            index += 1
-            while index < len(full_path_filenames):
-                # We try to index the remaining .mat files one by one 
-                try:
-                    sim = Simulation(full_path_filenames[index])
-                except :
-                    pass
-                else:
-                    if timecheck:                    
-                        # Now, check the simulation runtime against previously 
-                        # confirmed start and stop times
-                        time = sim.get_value('Time')
-                        if len(time) == 0:
-                            print '{} has a zero-length time vector, it is NOT indexed.'.format(sim.filename)
-                        elif self.simulationstart == time[0] and \
-                            self.simulationstop == time[-1]:
-                            # index this new simulation 
-                            self.index_one_sim(sim, process=process)
-                            print '%s indexed' % (sim.filename)
-                        else:
-                            print '%s, runs from %d s till %d s, therefore, it \
-                               is NOT indexed' % (sim.filename, time[0],time[-1])
-                    else:
-                        # index this new simulation 
-                        self.index_one_sim(sim, process=process)
-                        print '%s indexed' % (sim.filename)
-                index += 1
-        
-        else:
-            # there are already files in the simdex
-            index = 0
-            while index < len(full_path_filenames):
-                # We try to index the remaining .mat files one by one 
-                try:
-                    sim = Simulation(full_path_filenames[index])
-                except :
-                    pass
-                else:
-                    # Now, check the simulation runtime against previously confirmed
-                    # start and stop times
-                    time = sim.get_value('Time')
-                    
-                    if self.simulationstart == time[0] and \
-                        self.simulationstop == time[-1]:
-                        # index this new simulation 
-                        self.index_one_sim(sim, process=process)
-                        print '%s indexed' % (sim.filename)
-                            
-                    else:
-                        print '%s, runs from %d s till %d s, therefore, it is NOT \
-                             indexed' % (sim.filename, time[0],time[-1])
-                
-                index += 1            
-        
-     
+            # Only the headers and the time vector are read to check the file
+            try:
+                info = probe(filename)
+            except MemoryError:
+                print 'WARNING: %s could not be indexed because of a MemoryError.\nThe file is probably too big.  It could help to try in a fresh python instance' % (filename)
+                continue
+            except:
+                print '%s is no Dymola file.  It is not indexed' % (filename)
+                continue
+            
+            if info['start'] is None:
+                print '{} has a zero-length time vector, it is NOT indexed.'.format(filename)
+                continue
+            
+            first = getattr(self, 'simulationstart', None) is None
+            if not first and timecheck and \
+                (self.simulationstart != info['start'] or \
+                 self.simulationstop != info['stop']):
+                # the simulation runtime is not the same as for the 
+                # previously indexed files
+                print '%s, runs from %d s till %d s, therefore, it is NOT \
+                     indexed' % (filename, info['start'], info['stop'])
+                continue
+            
+            job = (len(jobs), filename, variables, process, grid)
+            if first:
+                # The first file is loaded here: only if that succeeds, its
+                # runtime is used to decide if the next files are ok or not. 
+                first_summary = _summarize_file(job)[1]
+                if first_summary is None:
+                    continue
+                print 'The first found simulation, %s, runs from %d s till %d s' % \
+                    (filename, info['start'], info['stop'])
+                self.simulationstart = info['start']
+                self.simulationstop = info['stop']
+            else:
+                jobs.append(job)
+            signatures[os.path.abspath(filename)] = \
+                _signature(filename, checksum) if checksum else signature
+        
+        if unchanged > 0:
+            print '%d files were already indexed and did not change' % \
+                (unchanged)
+        
+        # loading and post-processing can happen in worker processes, but the
+        # simdex and h5 file are only updated here, in the order of jobs
+        reindexed = []
+        summaries = _summaries(jobs, workers)
+        if first_summary is not None:
+            # the first file comes before all jobs in the sorted filenames
+            summaries = itertools.chain([first_summary], summaries)
+        try:
+            for summary in summaries:
+                if summary is None:
+                    continue
+                path = os.path.abspath(summary['filename'])
+                self._add_summary(summary, process=process, 
+                                  signature=signatures.get(path))
+                print '%s indexed' % (summary['filename'])
+                if replaced.has_key(path):
+                    reindexed.append(replaced[path])
+        finally:
+            # also the simulations indexed before an error are merged
+            self.merge_pending()
+            # a changed file that could not be indexed keeps its old SID
+            for sid in reindexed:
+                self.remove(sid)
 
         self.h5.close()
                 
@@ -454,36 +579,15 @@ class Simdex:
         '''
         
         
-        p = re.compile(regex, re.IGNORECASE)
+        partree, vartree = self._get_trees()
         if tp == 'all' or tp == 'par':
-            # we search for parameters in the fullnames
-            matchespar = []
-            for par in self.parameters:
-                m = p.search(par)
-                if m:
-                    matchespar.append(par)
-            # we also search in the shortnames, if present
-            if self.__dict__.has_key('pardic'):            
-                for par in self.pardic:
-                    m = p.search(par)
-                    if m:
-                        matchespar.append(par)
-            
+            # we search for parameters in the fullnames and in the 
+            # shortnames, if present
+            matchespar = partree.search(regex)
             
         if tp == 'all' or tp == 'var':
-            # we search for variables in the fullnames
-            matchesvar = []
-            for var in self.variables:
-                m = p.search(var)
-                if m:
-                    matchesvar.append(var)
-                    
-            # we also search in the shortnames
-            if self.__dict__.has_key('vardic'):
-                for var in self.vardic:
-                    m = p.search(var)
-                    if m:
-                        matchesvar.append(var)                    
+            # idem for the variables
+            matchesvar = vartree.search(regex)
           
         if tp == 'all':
             result = [matchespar, matchesvar]
@@ -498,6 +602,54 @@ class Simdex:
         return result
     
     
+    def _get_trees(self):
+        '''
+        Return a NameTree for the parameters and one for the variables.
+        
+        The trees contain the full names and the short names (pardic and 
+        vardic) and are built on first use.  They are reset by 
+        _names_changed() when parameters or variables are added or removed.
+        '''
+        
+        if getattr(self, '_trees', None) is None:
+            parameters = list(self.parameters)
+            variables = list(self.variables)
+            # without a process, the short names are the full names
+            if self.__dict__.has_key('pardic'):
+                known = set(parameters)
+                parameters.extend([n for n in self.pardic if n not in known])
+            if self.__dict__.has_key('vardic'):
+                known = set(variables)
+                variables.extend([n for n in self.vardic if n not in known])
+            self._trees = (NameTree(parameters), NameTree(variables))
+        return self._trees
+    
+    
+    def _names_changed(self):
+        '''Reset the name trees and their cached searches'''
+        
+        self._trees = None
+    
+    
+    def get_objects(self, mother=''):
+        '''
+        Return a sorted list with the names of the objects in a mother model
+        
+        The objects of both parameters and variables are returned.  
+        Example: mother = 'foo.fooBar'.  If no mother model is specified, 
+        the main objects are returned, except 'Time'. 
+        mother is the path of a model in the name tree, like a plain mother
+        in Simulation.get_objects().  Regular expressions are not supported.
+        '''
+        
+        partree, vartree = self._get_trees()
+        objects = set(partree.children(mother) + vartree.children(mother))
+        objects.discard('stateSelect')
+        if mother == '':
+            objects.discard('Time')
+        return sorted(objects)
+    
+    
     def __get_files(self, directory, non_wildcard_pattern):
         '''
         This function returns a list of filenames as strings, satisfying the 
@@ -513,7 +665,7 @@ class Simdex:
 
 
         
-    def index_one_sim(self, simulation, process=None):
+    def index_one_sim(self, simulation, process=None, grid=None):
         '''
         Add a Simulation instanct to a Simdex instance
         
@@ -524,81 +676,35 @@ class Simdex:
         
         simulation has to be a Simulation object
         process is a simman.Process object
+        grid (optional) is an array of time instants to which all
+        trajectories are resampled, see Simulation.extract
         
         Convention: in the h5 file, the short names are used, but with any '.'
         replaced by '_dot_'.  The h5 file only contains variables, no parameters.
         
         '''
         
-        # internal function to enhance readibility
-        def index_one_var(variables, varmap, var, index):
-            """
-            Updates the variables and varmap with var, keeping everything sorted
-            Important: index is the position of the last found var in variables
-            
-            Returns the new variables, varmap and index
-            """
-            
-            
-            
-            try:
-                if var==variables[index]:
-                    # var is the first element in variables, update varmap
-                    varmap[index,-1] = 1
-                    pos = index+1
-                else:# search for it in variables, but only in the part AFTER index
-                    pos=variables[index:].index(var)+index
-                    varmap[pos,-1] = 1
-            except(ValueError, IndexError):
-                # this variable was not found.  Add it in the right position
-                # keeping the list in sorted order
-                pos = bisect.bisect_left(variables, var, lo=index)
-                variables.insert(pos,var)
-                # make new row in variablemap and add '1' in the last column
-                varmap = np.insert(varmap, pos, 0, axis=0)
-                varmap[pos,-1] = 1
-                pos+=1
-            return variables, varmap, pos
-                    
-        # internal function to enhance readibility
-        def index_one_par(parameters, parmap, parvalues, par, index, parvalue):
-            """
-            Updates the parameters, parvalues and parmap with par, 
-            keeping everything sorted.
-            Important: 
-                - index is the position of the last found par in parameters
-                - parvalue is the value of par 
-            
-            Returns the new parameters, parmap, parvalues and index
-            """
-          
-            
-            try:
-                if par==parameters[index]:
-                    # par is the first element in parameters, update parmap, parvalues
-                    parmap[index,-1] = 1
-                    parvalues[index, -1] = parvalue
-                    pos = index+1
-                else:
-                    # search for it in parameters, but only in the part AFTER index
-                    pos=parameters[index:].index(par)+index
-                    parmap[pos,-1] = 1
-                    parvalues[pos, -1] = parvalue
-            except(ValueError, IndexError):
-                # this parameter was not found.  Add it in the right position
-                # keeping the list in sorted order
-                pos = bisect.bisect_left(parameters, par, lo=index)
-                parameters.insert(pos,par)
-                # make new row in parametermap and add '1' in the last column
-                parmap = np.insert(parmap, pos, 0, axis=0)
-                parmap[pos,-1] = 1
-                parvalues = np.insert(parvalues, pos, 0, axis=0)
-                parvalues[pos,-1] = parvalue
-                pos+=1
-            return parameters, parmap, parvalues, pos
-        
-        
-        def add_meta(simulation, key):
+        self._add_summary(_summarize(simulation, process, grid), process)
+        self.merge_pending()
+    
+    def _add_summary(self, summary, process=None, signature=None):
+        '''
+        Add a simulation to the simdex, from its summary (see _summarize())
+        
+        This is the part of index_one_sim() that updates the simdex 
+        attributes and the h5 file.  During a scan with workers, only the 
+        summaries are made in the worker processes and this method is called
+        in the main process only.
+        
+        signature is (size, mtime, md5) of the file, see scan().  If None, 
+        it is determined here, without checksum.
+        
+        The simulation is added to parametermap, parametervalues and 
+        variablemap by merge_pending(), for all pending simulations at once.
+        
+        '''
+        
+        def add_meta(summary, key):
             """Create a node for the simulation and add data to /Metadata"""
             
          
@@ -634,20 +740,14 @@ class Simdex:
                 meta = self.h5.createTable('/', 'Metadata', Meta, 
                             title='All metadata for the simulations')
             
-            # check if there's a log file 
-            logfilename = simulation.filename.replace('result_','dslog_')\
-                                             .replace('.mat','.txt')
-            try:
-                log = analyse_log(logfilename)
-                loganalysis=True
-            except(IOError):
-                print 'No %s found, log-analysis not possible' % logfilename
-                loganalysis=False
+            # the log file was analysed in _summarize()
+            log = summary['log']
+            loganalysis = log is not None
 
             # create all values for a new row            
             row = meta.row
             row['SID'] = key
-            row['path'] = simulation.filename
+            row['path'] = summary['filename']
             row['log_analysed'] = loganalysis
                
             if loganalysis:
@@ -657,133 +757,187 @@ class Simdex:
             row.append()
             meta.flush
             
-            # Create the node for all variable arrays
-            var_grp = self.h5.createGroup('/', key, title='All variables, as arrays')
-            
             self.h5.flush()
         
         
-        def update_h5(simulation, key):
+        def update_h5(summary, key):
             """
-            Update the h5 file with the variables defined by the process.
+            Write the arrays of the summary to the h5 file.
             Return a dictionary with shortname/longname pairs of everything
             that has been added to the h5.
             
-
+            Identical arrays are stored once, in /_blobs (see _store_blob).
+            The group of the simulation only contains hard links to them.
+            A constant trajectory is stored as its first value, with its 
+            length in the attribute length (see _read_h5).  Aliases are hard
+            links too, in the subgroup _neg if their sign is opposite.  
+            In format 2, see _write_arrays().
             """
             
-            #pdb.set_trace()
-            var_grp = self.h5.getNode('/', key)
-           
-            if process is None:
-                # add all variables to the h5, with full names
-                vardic = dict(zip(simulation.variables, simulation.variables))
-                extracted = simulation.extract(var=vardic, arrays = 'each')           
-                for shortname, arr in extracted.iteritems():
-                    name = shortname.replace('.', '_dot_')
-                    self.h5.createArray(var_grp, name, arr)
-                
-            else:
-                extracted = simulation.postprocess(process)
-                vardic = {}
-                for shortname, arr in extracted.iteritems():
-                    name = shortname.replace('.', '_dot_')
-                    ispar = process.parameters.has_key(shortname) or \
-                            process.parameters.has_key(name)
-                                
-                    if not ispar:
-                        self.h5.createArray(var_grp, name, arr)
-                        try:
-                            longname = process.variables[shortname]
-                        except(KeyError):
-                            longname = shortname
-                        vardic[shortname] = longname
+            if _format_version(self.h5) > 1:
+                _write_arrays(self.h5, key, summary['arrays'])
+                self.h5.flush()
+                self.cache.discard_where(lambda key: key[0] == _OFFSETS)
+                return summary['vardic']
             
+            # Create the node for all variable arrays
+            var_grp = self.h5.createGroup('/', key, title='All variables, as arrays')
+            neg_grp = None
+            for name, values, length, aliases in summary['arrays']:
+                target = _store_blob(self.h5, values, length)
+                _link_blob(self.h5, var_grp, name, target)
+                for alias, sign in aliases:
+                    if sign > 0:
+                        _link_blob(self.h5, var_grp, alias, target)
+                    else:
+                        if neg_grp is None:
+                            neg_grp = self.h5.createGroup(var_grp, '_neg',
+                                title='Aliases with opposite sign')
+                        _link_blob(self.h5, neg_grp, alias, target)
                 
             self.h5.flush()
-            return vardic
-        
-        # separate parameters from variables for simulation 
-        simulation.separate()
-        
-        if self.simulations == []:
-            # this is the first simulation to be added to self
-           key = self._gen_key()            
-           self.simulations.append(key)
-           self.files[key] = simulation.filename
-           add_meta(simulation, key)
-           vardic = update_h5(simulation, key)
-               
-           if self.verbose:
-               print "key = %s, filename = %s" % (key, self.files[key])
-           self.parameters = simulation.parameters # a LIST
-           self.variables = simulation.variables  # a LIST           
-           self.parametermap = np.ndarray((len(self.parameters), 1))
-           self.parametermap[:, 0] = 1
-           self.parametervalues = copy.copy(self.parametermap)
-           self.parametervalues[:, 0] = np.array(simulation.parametervalues)
-           self.variablemap = np.ndarray((len(self.variables), 1))
-           self.variablemap[:, 0] = 1
-           self.vardic = vardic
-           
-           self.h5.close()
+            return summary['vardic']
         
-        else:
-            # new simulation to be added to existing ones            
-            # First, add the simulation key to self.simulations            
-            key = self._gen_key()            
-            self.simulations.append(key)
-            self.files[key] = simulation.filename
-            add_meta(simulation, key)
-            vardic = update_h5(simulation, key)
-                      
-            if self.verbose:
-                print "Added simulation to set with at least one other simulation"
-                print "key = %s, filename = %s" % (key, self.files[key])
-            
-            # Second, make new columns for parametermap, parametervalues and 
-            # variablemap
-            self.parametermap = np.append(self.parametermap,
-                                          np.zeros((len(self.parameters), 1)),
-                                          axis=1)
-            self.parametervalues = np.append(self.parametervalues,
-                                          np.zeros((len(self.parameters), 1)),
-                                          axis=1)
-            self.variablemap = np.append(self.variablemap,
-                                          np.zeros((len(self.variables), 1)),
-                                          axis=1)                                          
-            
-            position = 0            
-            for var in simulation.variables:
-                self.variables, self.variablemap, position = index_one_var(self.variables, self.variablemap, var, position)
-            
-            position = 0            
-            for par, parvalue in zip(simulation.parameters, simulation.parametervalues):
-                self.parameters, self.parametermap, self.parametervalues, position = index_one_par(self.parameters, self.parametermap, self.parametervalues, par, position, parvalue)
-                
-                  
-            # finally, create or update self.vardic and self.pardic
-            if process is not None:
-                if not self.__dict__.has_key('vardic'):
-                    # it's the first time we do a postprocessing on this simdex,
-                    # probably because this was the first simulation to be indexed
-                    self.vardic = vardic
-                else:
-                    self.vardic.update(vardic)
-                               
-                if process.parameters is not None:
-                    try:
-                        self.pardic.update(process.parameters)
-                    except(AttributeError):
-                        self.pardic=process.parameters
-
-            # this method can be called on itself: close the h5 file afterwards
+        key = self._gen_key()
+        add_meta(summary, key)
+        try:
+            vardic = update_h5(summary, key)
+        except:
+            # no half-written simulation in the h5 file
+            if _format_version(self.h5) > 1:
+                _remove_offsets(self.h5, key)
+            else:
+                _remove_group(self.h5, key)
             self.h5.close()
+            raise
+        # this method can be called on itself: close the h5 file afterwards
+        self.h5.close()
+        
+        # the maps are only updated in merge_pending(), the SID is added to 
+        # simulations together with its pending entry
+        self.files[key] = summary['filename']
+        self._pending.append((key, summary['parameters'], 
+                              summary['parametervalues'], 
+                              summary['variables']))
+        self.simulations.append(key)
+        
+        if self.verbose:
+            print "key = %s, filename = %s" % (key, self.files[key])
+        
+        # finally, create or update self.vardic and self.pardic.  Without a 
+        # process, vardic contains all variables of this simulation, which can
+        # be missing in the previous ones.
+        if not self.__dict__.has_key('vardic'):
+            self.vardic = vardic
+        else:
+            self.vardic.update(vardic)
+        
+        if process is not None and process.parameters is not None:
+            try:
+                self.pardic.update(process.parameters)
+            except(AttributeError):
+                self.pardic=process.parameters
  
+        if signature is None:
+            try:
+                signature = _signature(summary['filename'])
+            except(OSError):
+                signature = None
+        self.signatures[key] = signature
+        
+        self._names_changed()
         # during the index_one_sim calls, the process is modified. It has to be
         # linked to the simdex.
         self.process = process
+    
+    def merge_pending(self):
+        '''
+        Add the simulations that were added by _add_summary() to the 
+        parameters, variables and their structures.
+        
+        All new names are merged with the existing ones in a single sort, and
+        the structures are interned once, so the cost is linear in the number
+        of simulations instead of quadratic.  scan() calls this method at the
+        end, index_one_sim() after each simulation.
+        '''
+        
+        if len(self._pending) == 0:
+            return
+        self._sync_maps()
+        
+        # the pending simulations go after the ones already in the maps, in
+        # the order they were added.  Pending SIDs that are not in 
+        # simulations anymore are dropped.
+        pending = set([entry[0] for entry in self._pending])
+        done = [sid for sid in self.simulations if sid not in pending]
+        self._pending = [entry for entry in self._pending 
+                         if entry[0] in self.simulations]
+        merged = len(done)
+        if merged > 0 and merged != len(self._parids):
+            raise ValueError('The maps of the simdex do not match its '
+                             'simulations')
+        self.simulations = done + [entry[0] for entry in self._pending]
+        if len(self._pending) == 0:
+            return
+        if merged == 0:
+            self.parameters, self.variables = [], []
+            self.parametermap = np.zeros((0, 0))
+            self.parametervalues = np.zeros((0, 0))
+            self.variablemap = np.zeros((0, 0))
+        
+        def merge(names, structures, ids, new_names):
+            """
+            Return the sorted union of names and all new_names, the interned
+            structures and ids of all simulations, the rows of names in the
+            union and a list with the rows of new_names for each new 
+            simulation.
+            """
+            
+            # the new simulations mostly have the same names
+            distinct = {}
+            new_ids = []
+            union = set(names)
+            for n in new_names:
+                key = tuple(n)
+                if not distinct.has_key(key):
+                    distinct[key] = len(distinct)
+                    union.update(n)
+                new_ids.append(distinct[key])
+            union = sorted(union)
+            index = np.array(union)
             
+            # a column for each old structure and each new distinct set
+            old_rows = np.searchsorted(index, np.array(names, 
+                                                        dtype=index.dtype))
+            n = structures.shape[1]
+            columns = np.zeros((len(union), n + len(distinct)), dtype=bool)
+            columns[old_rows, :n] = structures
+            new_rows = [None] * len(distinct)
+            for key, j in distinct.iteritems():
+                new_rows[j] = np.searchsorted(index, np.array(key, 
+                    dtype=index.dtype))
+                columns[new_rows[j], n + j] = True
+            
+            structures, inverse = _intern(columns)
+            ids = np.concatenate([inverse[ids], 
+                                  inverse[n + np.array(new_ids, dtype=int)]])
+            return union, structures, ids, old_rows, \
+                [new_rows[j] for j in new_ids]
+        
+        sids, parameters, parvalues, variables = zip(*self._pending)
+        union, self._parstructures, self._parids, old_rows, new_rows = merge(
+            self.parameters, self._parstructures, self._parids, parameters)
+        values = np.zeros((len(union), merged + len(parvalues)))
+        values[old_rows, :merged] = self.parametervalues
+        for j, rows in enumerate(new_rows):
+            values[rows, merged + j] = parvalues[j]
+        self.parameters, self.parametervalues = union, values
+        
+        self.variables, self._varstructures, self._varids = merge(
+            self.variables, self._varstructures, self._varids, variables)[:3]
+        self._pending = []
+        self._names_changed()
+
     def filter_similar(self, SID):
         '''
         Return a new simdex with similar simulations as SID (SIDxxxx)        
@@ -794,8 +948,8 @@ class Simdex:
         a different value
         '''
         
-        # Approach: copy self and remove the unneeded columns from 
-        # parametermap, parametervalues and variablemap by slicing
+        # Approach: copy self and keep the simulations with the same 
+        # parameter and variable structures as SID
         
         # Make sure the h5 file is closed (for the deepcopy to work)
         self.h5.close()
@@ -806,28 +960,16 @@ class Simdex:
             print "This SID is not present in the simdex: %s" % SID
             raise
         
+        # identical structures have the same id
+        self._sync_maps()
+        s = (self._parids == self._parids[seqnb]) & \
+            (self._varids == self._varids[seqnb])
         newsimdex = copy.deepcopy(self)
-        newsimdex.simulations = []
-        
-        parmap = self.parametermap[:, seqnb]
-        varmap = self.variablemap[:, seqnb]
-        
-        sims_to_keep = []
-        
-        for i in range(len(self.simulations)):
-            if np.all(self.parametermap[:, i] == parmap) and \
-                np.all(self.variablemap[:, i] == varmap):
-                # we have catched an identical simulation
-                sims_to_keep.append(True)
-                newsimdex.simulations.append(self.simulations[i])
-            else:
-                sims_to_keep.append(False)
-            
-        # slicing only works with an array
-        s = np.array(sims_to_keep)
-        newsimdex.parametermap = newsimdex.parametermap[ : , s]
+        newsimdex.simulations = [sid for (sid, keep) in 
+                                 zip(self.simulations, s) if keep]
+        newsimdex._parids = newsimdex._parids[s]
         newsimdex.parametervalues = newsimdex.parametervalues[ : , s]
-        newsimdex.variablemap = newsimdex.variablemap[ : , s]
+        newsimdex._varids = newsimdex._varids[s]
         
         # remove all empty rows and corresponding parameters/variables
         newsimdex.cleanup()
@@ -856,12 +998,10 @@ class Simdex:
                 cols_to_remove.append(col)
                 newsimdex.simulations.remove(sid)
                 
-        newsimdex.parametermap = np.delete(newsimdex.parametermap, 
-                                           cols_to_remove, 1)
+        newsimdex._parids = np.delete(newsimdex._parids, cols_to_remove)
         newsimdex.parametervalues = np.delete(newsimdex.parametervalues, 
                                               cols_to_remove, 1)
-        newsimdex.variablemap = np.delete(newsimdex.variablemap, 
-                                          cols_to_remove, 1)
+        newsimdex._varids = np.delete(newsimdex._varids, cols_to_remove)
         
         newsimdex.cleanup()
         return newsimdex
@@ -891,12 +1031,10 @@ class Simdex:
                 cols_to_remove.append(col)
                 newsimdex.simulations.remove(sid)
                 
-        newsimdex.parametermap = np.delete(newsimdex.parametermap, 
-                                           cols_to_remove, 1)
+        newsimdex._parids = np.delete(newsimdex._parids, cols_to_remove)
         newsimdex.parametervalues = np.delete(newsimdex.parametervalues, 
                                               cols_to_remove, 1)
-        newsimdex.variablemap = np.delete(newsimdex.variablemap, 
-                                          cols_to_remove, 1)
+        newsimdex._varids = np.delete(newsimdex._varids, cols_to_remove)
         
         newsimdex.cleanup()
         return newsimdex    
@@ -935,7 +1073,9 @@ class Simdex:
         
         values = np.array(values)
         arows = np.array(rows)
-        reduced_par_map = self.parametermap[arows]
+        # only the structures of the rows in pardic
+        self._sync_maps()
+        reduced_structures = self._parstructures[arows]
         reduced_par_val = self.parametervalues[arows]
         
         
@@ -950,11 +1090,11 @@ class Simdex:
         
         # if there are no parmaprows, we don't need to filter on empty strings
         if len(parmaprows)>0:
-            selmap = reduced_par_map[parmaprows]
-            # selmap contains rows with 0 and 1's for each of the simulations
-            # (columns).  We need to get the simulation numbers (column numbers)
-            # that are FINE, meaning that the columns are unit columns
-            satisfyingmap = selmap.all(axis = 0)
+            selmap = reduced_structures[parmaprows]
+            # selmap contains rows with True and False for each of the 
+            # structures (columns).  We need the simulations of which the 
+            # structure is FINE, meaning that its column is all True
+            satisfyingmap = selmap.all(axis = 0)[self._parids]
             # satisfying is a boolean array, true if corresponding simulation 
             # is still in the run for selection
         else:
@@ -991,9 +1131,9 @@ class Simdex:
         newsimdex = copy.deepcopy(self)
         newsimdex.simulations = \
             [x for (x, y) in zip(self.simulations, satisfying) if y == True]
-        newsimdex.parametermap = self.parametermap[:, satisfying]
+        newsimdex._parids = self._parids[satisfying]
         newsimdex.parametervalues = self.parametervalues[:, satisfying]
-        newsimdex.variablemap = self.variablemap[:, satisfying]
+        newsimdex._varids = self._varids[satisfying]
             
         # we want to keep track of the parameters we have filtered on
         # this should be improved: if two identical keys occur, take the key
@@ -1010,6 +1150,43 @@ class Simdex:
 
         return newsimdex
     
+    def remove(self, SID):
+        '''
+        Remove simulation SID (SIDxxxx) from this simdex and from the h5 file
+        
+        Parameters and variables that only occured in this simulation are 
+        removed too (see cleanup()).  The row of SID in /Metadata is kept, 
+        so that the SID is never used again for another simulation.
+        Arrays in /_blobs are removed when no simulation links to them 
+        anymore.  In format 2, only the offsets of SID are removed, the 
+        space of its values is regained by convert_h5().
+        '''
+        
+        # the columns of the maps have to match self.simulations
+        self.merge_pending()
+        self._sync_maps()
+        try:
+            col = self.simulations.index(SID)
+        except(ValueError):
+            print "This SID is not present in the simdex: %s" % SID
+            raise
+        
+        self.simulations.pop(col)
+        self.cache.discard_where(lambda key: key[0] == SID)
+        self._parids = np.delete(self._parids, col)
+        self.parametervalues = np.delete(self.parametervalues, col, 1)
+        self._varids = np.delete(self._varids, col)
+        self.identifiers.pop(SID, None)
+        self.cleanup()
+        
+        self.openh5()
+        if _format_version(self.h5) > 1:
+            _remove_offsets(self.h5, SID)
+            self.cache.discard_where(lambda key: key[0] == _OFFSETS)
+        else:
+            _remove_group(self.h5, SID)
+        self.h5.close()
+    
     def cleanup(self):
         '''
         Removes unused parameters, variables and filenamesfrom a simdex
@@ -1024,18 +1201,28 @@ class Simdex:
         for col, sid in enumerate(self.simulations):
             new_files[sid] = self.files[sid]
         self.files = new_files
+        self.signatures = dict([(sid, self.signatures[sid]) for sid in 
+                                self.simulations if 
+                                self.signatures.has_key(sid)])
         
 
-        # next, remove all parameters/variables that are not in the maps anymore
-        pars_to_keep = np.any(self.parametermap, 1)
-        self.parametermap = self.parametermap[pars_to_keep]
+        # next, remove the structures that are not used anymore, and all 
+        # parameters/variables that are not in the structures anymore
+        self._sync_maps()
+        self._parstructures, self._parids = _compact(self._parstructures, 
+                                                     self._parids)
+        pars_to_keep = np.any(self._parstructures, 1)
+        self._parstructures = self._parstructures[pars_to_keep]
         self.parametervalues = self.parametervalues[pars_to_keep]
         self.parameters = [x for (x, y) in \
             zip(self.parameters, pars_to_keep) if y == True]
-        vars_to_keep = np.any(self.variablemap, 1)
+        self._varstructures, self._varids = _compact(self._varstructures, 
+                                                     self._varids)
+        vars_to_keep = np.any(self._varstructures, 1)
         self.variables = [x for (x, y) in \
             zip(self.variables, vars_to_keep) if y == True]
-        self.variablemap = self.variablemap[vars_to_keep]
+        self._varstructures = self._varstructures[vars_to_keep]
+        self._names_changed()
         
 
     def get(self, name, aggregate=None):
@@ -1072,8 +1259,8 @@ class Simdex:
         if not found_name:
             try:
                 if self.vardic.has_key(name):
-                    resdic = self._get_var_h5(name, selection=self.simulations)
-                    time = self._get_var_h5('Time', selection=self.simulations)
+                    resdic, time = self._get_vars_h5([name, 'Time'], 
+                                                     self.simulations)
                     found_name = True
             except(AttributeError):
                 pass
@@ -1104,10 +1291,8 @@ class Simdex:
                     for shortname, longname in self.vardic.iteritems():
                         if name == longname:
                             print 'shortname found', shortname
-                            resdic = self._get_var_h5(shortname, 
-                                                    selection=self.simulations)
-                            time = self._get_var_h5('Time', 
-                                                    selection=self.simulations)
+                            resdic, time = self._get_vars_h5(
+                                [shortname, 'Time'], self.simulations)
                 except(AttributeError):
                     pass
                 else:
@@ -1119,9 +1304,11 @@ class Simdex:
         # 5. aggregation option: the name is a sub_var
         if not found_name and self.process.sub_vars.has_key(name):
             # we loop over the mothers and put all the arrays together
-            for m in self.process.mothers:
-                single_array = self._get_var_h5(var=m+'_'+name, 
-                                                selection=self.simulations)
+            arrays = self._get_vars_h5(
+                [m+'_'+name for m in self.process.mothers] + ['Time'], 
+                self.simulations)
+            time = arrays.pop()
+            for m, single_array in zip(self.process.mothers, arrays):
                 if m == self.process.mothers[0]:
                     #initiate the resulting dictionary
                     resdic = copy.deepcopy(single_array)
@@ -1143,7 +1330,6 @@ class Simdex:
                 # the shape probably is of length 1 or even 0
                 pass
             
-            time = self._get_var_h5('Time', selection=self.simulations)
             found_name = True
   
         if not found_name:
@@ -1159,38 +1345,121 @@ class Simdex:
     def _get_var_h5(self, var, selection=[]):
         """Get values of variables that are stored in the h5 file"""
         
-        self.openh5()
+        return self._get_vars_h5([var], selection)[0]
+    
+    def _get_vars_h5(self, variables, selection=[]):
+        """
+        Return a list with a dictionary SID:values for each of the variables
+        that are stored in the h5 file.  
+        
+        Only the SID's in selection are returned (all simulations of this 
+        simdex if selection is empty).  A simulation that does not have a 
+        variable is not in its dictionary.
+        
+        The values are taken from self.cache if possible.  The simulations 
+        with at least one variable that is not in the cache are read with
+        _read_vars_h5(), and added to the cache.  The returned arrays are
+        copies, so changing them does not change the cache, except for 
+        constant trajectories: these stay read-only broadcast views (see 
+        _read_h5 and _hand_out).
+        """
         
-        values = {}
-        var_replaced = var.replace('.', '_dot_')
-        if selection == []:
-            selection = [n._v_name for n in self.h5.listNodes('/')]
-            
-        for node in self.h5.iterNodes('/'):
+        if len(selection) == 0:
+            selection = self.simulations
+        
+        names = [var.replace('.', '_dot_') for var in variables]
+        result = [{} for name in names]
+        missing = []
+        for sid in selection:
+            arrays = [self.cache.get((sid, name), _NOT_CACHED) 
+                      for name in names]
+            if any([array is _NOT_CACHED for array in arrays]):
+                missing.append(sid)
+                continue
+            for values, array in zip(result, arrays):
+                # None: the simulation does not have this variable
+                if array is not None:
+                    values[sid] = _hand_out(array)
+        
+        if len(missing) > 0:
+            read = self._read_vars_h5(names, missing)
+            for sid in missing:
+                for name, values, values_read in zip(names, result, read):
+                    array = values_read.get(sid)
+                    self.cache.put((sid, name), array)
+                    if array is not None:
+                        values[sid] = _hand_out(array)
+        return result
+    
+    def _read_vars_h5(self, variables, selection=[]):
+        """
+        Return a list with a dictionary SID:values for each of the variables
+        that are stored in the h5 file, see _get_vars_h5().
+        
+        Only the groups of the SID's in selection are read (all simulations 
+        in the h5 file if selection is empty), in a single pass with the h5
+        file open.
+        """
+        
+        self.openh5()
+        names = [var.replace('.', '_dot_') for var in variables]
+        if _format_version(self.h5) > 1:
+            result = []
+            for name in names:
+                # the offsets tables are cached too, see _OFFSETS
+                offsets = self.cache.get((_OFFSETS, name), _NOT_CACHED)
+                if offsets is _NOT_CACHED:
+                    offsets = _read_offsets(self.h5, name)
+                    self.cache.put((_OFFSETS, name), offsets)
+                if offsets is None:
+                    result.append({})
+                else:
+                    result.append(_read_variable(self.h5, name, selection,
+                                                 offsets))
+            self.h5.close()
+            return result
+        
+        if len(selection) == 0:
+            selection = [n._v_name for n in 
+                         self.h5.iterNodes('/', classname='Group') 
+                         if n._v_name != '_blobs']
+        result = [{} for name in names]
+        for sid in selection:
             try:
-                # move on if this node is NOT in the selection
-                selection.index(node._v_name)
-                try:
-                    # look up the variable in this node
-                    array = self.h5.getNode(node, name=var_replaced)
-                    values[node._v_name] = array.read()
-                except(tbl.NoSuchNodeError):
-                    # either the node is Metadata, or this variable does not
-                    # exist in this node (perfectly possible and normal)
-                    pass                    
-                    #raise tbl.NoSuchNodeError(var + " not found in node " + node._v_pathname)
-            except(ValueError):
-                # it's a node that was not in the selection
-                if self.verbose:
-                    print " node not selected: ", node._v_name
-                pass
-            
-            
-       
+                group = self.h5.getNode('/', sid)
+            except(tbl.NoSuchNodeError):
+                continue
+            children = group._v_children
+            # aliases with opposite sign, see index_one_sim
+            negatives = None
+            if '_neg' in children:
+                negatives = children['_neg']._v_children
+            for name, values in zip(names, result):
+                if name in children:
+                    values[sid] = self._read_h5(children[name])
+                elif negatives is not None and name in negatives:
+                    values[sid] = self._read_h5(negatives[name], sign=-1)
+        
         self.h5.close()
-        return values        
-    
+        return result
     
+    def _read_h5(self, array, sign=1):
+        """
+        Return the values of an array in the h5 file, multiplied by sign.
+        
+        A constant trajectory is stored as a single value with its length in
+        the attribute length (see index_one_sim).  It is returned as a 
+        read-only broadcast view, so it only takes memory when a full copy 
+        is made.
+        """
+        
+        values = array.read()
+        if sign < 0:
+            values = -values
+        length = getattr(array.attrs, 'length', None)
+        if length is not None:
+            values = np.broadcast_to(values, (length,))
+        return values
     
     def _get_par(self, parameter):
         '''
@@ -1209,19 +1478,17 @@ class Simdex:
 #        result = [range(1, len(self.simulations)),\
 #            self.parametervalues[parindex, 1:], self.simulations[1:]]
         
-        presence = self.parametermap[parindex,:]        
+        self._sync_maps()
+        presence = self._parstructures[parindex, self._parids]
         value = self.parametervalues[parindex, :]
         # take care, first element is dummy value (zero)
         
         result = {}
         for i, sid in enumerate(self.simulations):
-            if presence[i] == 0:
-                result[sid] = None
-            elif presence[i] == 1:
+            if presence[i]:
                 result[sid] = value[i]
             else:
-                raise NotImplementedError('It is not possible to have something\
-                  else than 0 or 1 in parametermap')
+                result[sid] = None
         
         return result
 
@@ -1303,6 +1570,99 @@ class Simdex:
         return sids
         
     
+    def analyse_cputime(self, variables=None, interval=900, screendump=30,
+                        workers=1, chunksize=1000):
+        """
+        Analyse the relation between cputime and the variables over all 
+        simulations in the simdex.
+        
+        For each simulation, the Spearman correlation between the cputime 
+        and each variable is computed like Simulation.analyse_cputime().  The
+        simulations are streamed: they are read one by one (or by a pool of 
+        workers processes) and only the running sums per variable are kept.
+        
+        Parameters:
+        -----------
+        * variables: list with the full names of the variables to analyse. 
+          If None, all variables of each simulation are analysed.
+        * interval: the desired interval for resampling, integer in seconds
+        * screendump: integer, number of lines to print.  A negative number
+          prints all the results
+        * workers: number of processes to analyse the simulations in parallel
+        * chunksize: see Simulation.analyse_cputime()
+        
+        Output:
+        -------
+        pandas DataFrame with the variable names as index and columns
+            - mean: the mean correlation over all simulations
+            - std: the standard deviation of the correlation
+            - count: the number of simulations with a valid correlation for 
+              this variable
+        The DataFrame is sorted on the absolute value of the mean correlation.
+        Simulations without CPUtime or with a wrong interval, and files that
+        cannot be read, are skipped.
+        """
+        
+        tasks = [(self.files[SID], variables, interval, chunksize) 
+                 for SID in self.simulations]
+        if use_pool(workers) and len(tasks) > 1:
+            pool = Pool(workers)
+            results = pool.imap(_analyse_cputime_file, tasks)
+        else:
+            pool = None
+            results = (_analyse_cputime_file(task) for task in tasks)
+        
+        # name:(count, mean, sum of squared deviations) of the valid 
+        # correlations, updated with Welford's method
+        stats = {}
+        try:
+            for task, res in zip(tasks, results):
+                if res is False:
+                    print '%s could not be read, skipped' % task[0]
+                    continue
+                if res is None:
+                    print '%s has no valid CPUtime trajectory, skipped' % task[0]
+                    continue
+                for name, corr in res.iteritems():
+                    if np.isnan(corr):
+                        continue
+                    n, avg, m2 = stats.get(name, (0, 0., 0.))
+                    n += 1
+                    delta = corr - avg
+                    avg += delta / n
+                    stats[name] = (n, avg, m2 + delta * (corr - avg))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        
+        names, mean, std, count = sorted(stats), [], [], []
+        for name in names:
+            n, avg, m2 = stats[name]
+            mean.append(avg)
+            count.append(n)
+            if n > 1:
+                std.append(np.sqrt(m2 / (n - 1)))
+            else:
+                std.append(np.nan)
+        table = pd.DataFrame({'mean': mean, 'std': std, 'count': count}, 
+                             index=names, columns=['mean', 'std', 'count'])
+        order = np.argsort(-np.abs(np.array(mean)), kind='mergesort')
+        table = table.iloc[order]
+        
+        if screendump < 0:
+            nlines = len(table)
+        else:
+            nlines = screendump
+        if nlines > 0:
+            print 'The highest correlations were found for :'
+            for name, row in table[:nlines].iterrows():
+                print '\t', name, '.'*(50-len(name)), ' ==> ', \
+                    '%.2f (std %.2f, %d sims)' % (row['mean'], row['std'], 
+                                                 row['count'])
+        
+        return table
+        
     def save(self, filename):
         """
         save(filename)
@@ -1323,6 +1683,9 @@ class Simdex:
         # saving
         
         del self.h5
+        # the name trees are rebuilt when needed, the maps are computed 
+        self._names_changed()
+        self._sync_maps()
         old_h5 = copy.copy(self.h5_path)
         self.h5_path = os.path.split(self.h5_path)[-1]
         #print 'self.h5 removed'
@@ -1337,6 +1700,25 @@ class Simdex:
         self.h5.close()
         
         return filename + ' created'
+    
+    def convert_h5(self, h5):
+        """
+        Convert the h5 file of this simdex to format version 2 (see the 
+        Simdex docstring) and link the simdex to the new file h5.
+        
+        The original h5 file is not changed.  Other simdexes that share it 
+        (eg. made by a filter) stay linked to the original file.
+        """
+        
+        self.openh5()
+        self.h5.close()
+        h5_path = os.path.join(os.getcwd(), h5)
+        convert_h5(self.h5_path, h5_path)
+        self.h5_path = h5_path
+        # the offsets in the cache belong to the original file
+        self.cache = ArrayCache(self.cache.maxbytes)
+        self.h5 = tbl.openFile(self.h5_path, 'a')
+        self.h5.close()
         
     def postproc(self):
         """Run the post-processing"""
@@ -1398,9 +1780,637 @@ def apply(function, results):
     return result
 
 
+def _analyse_cputime_file(args):
+    """
+    Return the correlations of Simulation.analyse_cputime() for a single file,
+    None if the file has no (valid) CPUtime trajectory or False if it cannot
+    be read.  
+    
+    args = (filename, variables, interval, chunksize), this function is 
+    used by Simdex.analyse_cputime, also in a pool of worker processes.
+    """
+    
+    filename, variables, interval, chunksize = args
+    try:
+        if variables is None:
+            sim = Simulation(filename)
+            return sim.analyse_cputime(interval=interval, screendump=0, 
+                                       chunksize=chunksize)
+        else:
+            sim = Simulation(filename, variables=list(variables) + ['CPUtime'])
+            extracted = sim.extract(dict(zip(variables, variables)))
+            return sim.analyse_cputime(extracted, interval=interval, 
+                                       screendump=0, chunksize=chunksize)
+    except (ValueError, IndexError):
+        return None
+    except IOError:
+        return False
+
+
+def _hand_out(array):
+    """
+    Return a cached array to a caller of Simdex._get_vars_h5: a copy, or a 
+    read-only view if array is a broadcast view of a constant trajectory.
+    """
+    
+    if 0 in array.strides:
+        view = array.view()
+        view.flags.writeable = False
+        return view
+    return np.array(array)
+
+
+# layouts of the h5 file, see Simdex
+FORMAT_VERSIONS = (1, 2)
+# marks a key that is not in Simdex.cache
+_NOT_CACHED = object()
+# first item of the keys of the offsets tables in Simdex.cache (format 2)
+_OFFSETS = '/offsets'
+# map:(structures, ids) attributes of Simdex, see Simdex.__getattr__
+_MAPS = {'parametermap': ('_parstructures', '_parids'), 
+         'variablemap': ('_varstructures', '_varids')}
+_MAP_OF = dict([(attr, name) for name, attrs in _MAPS.items() 
+                for attr in attrs])
+# maximum length of a variable name (h5 name) in format 2, see _Offsets
+_NAME_BYTES = 255
+# compression of the values in format 2
+_FILTERS = tbl.Filters(complevel=5, complib='zlib', shuffle=True)
+
+
+class _Offsets(tbl.IsDescription):
+    """
+    Position of the trajectory of a simulation in /variables/name/values.
+    
+    source is the name of the variable with the values if this is an alias,
+    '' otherwise.  A constant trajectory is stored as a single value 
+    (stored=1), length is its full length.
+    """
+    SID = tbl.StringCol(itemsize=16, pos=0)
+    source = tbl.StringCol(itemsize=_NAME_BYTES, pos=1)
+    start = tbl.Int64Col(pos=2)
+    stored = tbl.Int64Col(pos=3)
+    ndim = tbl.Int8Col(pos=4)
+    length = tbl.Int64Col(pos=5)
+    width = tbl.Int64Col(pos=6)
+    sign = tbl.Int8Col(pos=7)
+
+
+class _Blob(tbl.IsDescription):
+    """Position of stored values with digest (see _digest) in format 2"""
+    digest = tbl.StringCol(itemsize=36, pos=0)
+    source = tbl.StringCol(itemsize=_NAME_BYTES, pos=1)
+    start = tbl.Int64Col(pos=2)
+
+
+def _format_version(h5):
+    """Return the format version of the open h5 file of a simdex"""
+    
+    return getattr(h5.root._v_attrs, 'format_version', 1)
+
+
+def _variable_group(h5, name):
+    """Return the group /variables/name in format 2, create it if needed"""
+    
+    try:
+        return h5.getNode('/variables', name)
+    except(tbl.NoSuchNodeError):
+        pass
+    try:
+        variables = h5.getNode('/variables')
+    except(tbl.NoSuchNodeError):
+        variables = h5.createGroup('/', 'variables', 
+                                   title='All variables, one group each')
+    group = h5.createGroup(variables, name)
+    h5.createEArray(group, 'values', tbl.Float64Atom(), (0,), 
+                    filters=_FILTERS)
+    h5.createTable(group, 'offsets', _Offsets, filters=_FILTERS)
+    return group
+
+
+def _digest(values, length=None):
+    """
+    Return a name for the contents of an array: identical arrays (values, 
+    shape, dtype and length of a constant trajectory) have the same name.
+    """
+    
+    values = np.asarray(values)
+    digest = hashlib.md5(np.ascontiguousarray(values))
+    digest.update(repr((values.shape, values.dtype.str, length)))
+    return 'md5_' + digest.hexdigest()
+
+
+def _store_blob(h5, values, length=None):
+    """
+    Return the array with values in /_blobs of an h5 file in format 1, 
+    create it if needed.
+    
+    The name of the array is its digest.  Its attribute references is the 
+    number of links to it in the groups of the simulations, see _link_blob.
+    """
+    
+    digest = _digest(values, length)
+    try:
+        return h5.getNode('/_blobs', digest)
+    except(tbl.NoSuchNodeError):
+        pass
+    try:
+        blobs = h5.getNode('/_blobs')
+    except(tbl.NoSuchNodeError):
+        blobs = h5.createGroup('/', '_blobs', 
+                               title='Arrays by content, linked by the SIDs')
+    blob = h5.createArray(blobs, digest, values)
+    blob.attrs.digest = digest
+    blob.attrs.references = 0
+    if length is not None:
+        blob.attrs.length = length
+    return blob
+
+
+def _link_blob(h5, group, name, blob):
+    """Create a hard link group/name to blob, see _store_blob"""
+    
+    h5.createHardLink(group, name, blob)
+    blob.attrs.references += 1
+
+
+def _remove_group(h5, sid):
+    """
+    Remove the group of simulation sid from an h5 file in format 1, and the
+    arrays in /_blobs that are not linked anymore.
+    """
+    
+    try:
+        group = h5.getNode('/', sid)
+    except(tbl.NoSuchNodeError):
+        return
+    # arrays written before /_blobs existed have no digest
+    digests = [getattr(leaf.attrs, 'digest', None) for leaf in 
+               h5.walkNodes(group, 'Leaf')]
+    h5.removeNode(group, recursive=True)
+    for digest in digests:
+        if digest is None:
+            continue
+        blob = h5.getNode('/_blobs', digest)
+        blob.attrs.references -= 1
+        if blob.attrs.references <= 0:
+            h5.removeNode(blob)
+
+
+def _blob_table(h5):
+    """Return the table /_blobs of an h5 in format 2, create it if needed"""
+    
+    try:
+        return h5.getNode('/_blobs')
+    except(tbl.NoSuchNodeError):
+        pass
+    blobs = h5.createTable('/', '_blobs', _Blob, filters=_FILTERS,
+                           title='Stored values by content')
+    blobs.cols.digest.createIndex()
+    return blobs
+
+
+def _write_arrays(h5, sid, arrays):
+    """
+    Append the arrays of simulation sid to an h5 file in format 2.
+    
+    arrays is a list with (name, values, length, aliases), see _summarize().
+    Identical values are stored once, in the values array of the variable 
+    that had them first (see the table /_blobs).  The other variables and 
+    the aliases only get a row in their offsets table that refers to them.
+    The offsets tables are written when h5 is flushed.
+    
+    A ValueError is raised, before anything is written, if a name is longer
+    than _NAME_BYTES: it would be truncated in the offsets tables.
+    """
+    
+    for name, values, length, aliases in arrays:
+        if len(name) > _NAME_BYTES:
+            raise ValueError('%s is longer than %d characters, it cannot be '
+                             'stored in format 2' % (name, _NAME_BYTES))
+    blobs = _blob_table(h5)
+    for name, values, length, aliases in arrays:
+        values = np.asarray(values, dtype=float)
+        if values.ndim > 2:
+            raise ValueError('%s has more than 2 dimensions' % name)
+        group = _variable_group(h5, name)
+        digest = _digest(values, length)
+        found = [(row['source'], row['start']) for row in 
+                 blobs.where('digest == value', {'value': digest})]
+        if len(found) > 0:
+            source, start = found[0]
+        else:
+            source, start = name, group.values.nrows
+            group.values.append(values.ravel())
+            row = blobs.row
+            row['digest'] = digest
+            row['source'] = source
+            row['start'] = start
+            row.append()
+            blobs.flush()
+        if length is None:
+            length = values.shape[0] if values.ndim > 0 else 0
+        width = values.shape[1] if values.ndim == 2 else 0
+        for target, sign in [(group, 1)] + \
+            [(_variable_group(h5, alias), sign) for alias, sign in aliases]:
+            row = target.offsets.row
+            row['SID'] = sid
+            # '' if the values are in the values array of target itself
+            row['source'] = '' if target._v_name == source else source
+            row['start'] = start
+            row['stored'] = values.size
+            row['ndim'] = values.ndim
+            row['length'] = length
+            row['width'] = width
+            row['sign'] = sign
+            row.append()
+
+
+def _read_offsets(h5, name):
+    """
+    Return the offsets table of variable name (h5 name) of an h5 file in 
+    format 2 as a record array, None if the variable is not in the file.
+    """
+    
+    try:
+        group = h5.getNode('/variables', name)
+    except(tbl.NoSuchNodeError):
+        return None
+    return group.offsets.read()
+
+
+def _read_variable(h5, name, selection=[], offsets=None):
+    """
+    Return a dictionary with SID:values for variable name (h5 name) from an
+    h5 file in format 2.  selection is a list of SID's, all if empty.
+    
+    offsets is the offsets table of the variable (see _read_offsets), it is
+    read from the h5 file if not given.  
+    Each selected trajectory is read on its own, except for trajectories 
+    that are adjacent or overlap in the values array: these are read in a 
+    single slice.
+    """
+    
+    if offsets is None:
+        offsets = _read_offsets(h5, name)
+        if offsets is None:
+            return {}
+    if len(selection) > 0:
+        offsets = offsets[np.in1d(offsets['SID'], selection)]
+    
+    result = {}
+    for source in np.unique(offsets['source']):
+        rows = offsets[offsets['source'] == source]
+        rows = rows[np.argsort(rows['start'], kind='mergesort')]
+        if source == '':
+            values = h5.getNode('/variables', name).values
+        else:
+            values = h5.getNode('/variables', source).values
+        # a row starts a new slice if it begins after the end of all 
+        # previous rows
+        ends = np.maximum.accumulate(rows['start'] + rows['stored'])
+        new_slice = np.ones(len(rows), dtype=bool)
+        new_slice[1:] = rows['start'][1:] > ends[:-1]
+        firsts = np.nonzero(new_slice)[0]
+        lasts = np.append(firsts[1:], len(rows))
+        for first, last in zip(firsts, lasts):
+            begin = rows['start'][first]
+            data = values[begin:ends[last - 1]]
+            for row in rows[first:last]:
+                start = row['start'] - begin
+                # a copy, so that a cached array does not keep data alive
+                array = np.array(data[start:start + row['stored']])
+                if row['sign'] < 0:
+                    array = -array
+                if row['ndim'] == 0:
+                    array = array.reshape(())
+                elif row['ndim'] == 2:
+                    array = array.reshape((row['length'], row['width']))
+                elif row['stored'] != row['length']:
+                    # constant trajectory, see _summarize()
+                    array = np.broadcast_to(array, (row['length'],))
+                result[str(row['SID'])] = array
+    return result
+
+
+def _remove_offsets(h5, sid):
+    """Remove simulation sid from all offsets tables of an h5 in format 2"""
+    
+    try:
+        variables = h5.getNode('/variables')
+    except(tbl.NoSuchNodeError):
+        return
+    for group in h5.iterNodes(variables):
+        offsets = group.offsets.read()
+        keep = offsets['SID'] != sid
+        if not np.all(keep):
+            group.offsets.truncate(0)
+            group.offsets.append(offsets[keep])
+            group.offsets.flush()
+
+
+def convert_h5(source, target):
+    """
+    Convert the h5 file of a simdex to format version 2 (see Simdex).
+    
+    source is an h5 file in format 1 or 2, target is the new h5 file.  
+    Identical arrays (eg. the links of aliases in format 1) are stored 
+    once.  Converting a file in format 2 leaves out the values of 
+    removed simulations.
+    """
+    
+    src = tbl.openFile(source, 'r')
+    try:
+        dst = tbl.openFile(target, 'w', title='Simdex file')
+        try:
+            dst.root._v_attrs.format_version = 2
+            try:
+                src.getNode('/Metadata').copy(dst.root)
+            except(tbl.NoSuchNodeError):
+                pass
+            if _format_version(src) > 1:
+                sids = [sid for sid in src.getNode('/Metadata').cols.SID]
+                # (name, {SID:its row of the offsets table}), read only once
+                offsets = []
+                for group in src.iterNodes('/variables'):
+                    table = group.offsets.read()
+                    offsets.append((group._v_name, dict(
+                        [(str(sid), table[i:i+1]) 
+                         for i, sid in enumerate(table['SID'])])))
+                for sid in sids:
+                    arrays = [(name, _read_variable(src, name, [], rows[sid]))
+                              for name, rows in offsets if rows.has_key(sid)]
+                    _write_arrays(dst, sid, _identical_arrays(
+                        [(name, values[sid], 1) for name, values in arrays
+                         if values.has_key(sid)]))
+            else:
+                for group in src.iterNodes('/', classname='Group'):
+                    if group._v_name == '_blobs':
+                        continue
+                    leaves = [(n._v_name, n, 1) for n in 
+                              src.iterNodes(group, classname='Leaf')]
+                    try:
+                        leaves += [(n._v_name, n, -1) for n in 
+                                   src.iterNodes(group._v_pathname + '/_neg')]
+                    except(tbl.NoSuchNodeError):
+                        pass
+                    _write_arrays(dst, group._v_name, _identical_arrays(
+                        [(name, _Stored(node), sign) 
+                         for name, node, sign in leaves]))
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
+
+class _Stored(object):
+    """An array in an h5 file in format 1 with its attribute length"""
+    
+    def __init__(self, node):
+        self.values = node.read()
+        self.length = getattr(node.attrs, 'length', None)
+
+
+def _identical_arrays(leaves):
+    """
+    Return a list with (name, values, length, aliases) as in _summarize() 
+    for leaves, a list of (name, values, sign) with the values as stored 
+    (a _Stored or an array).  Identical arrays become aliases of the first
+    one.
+    """
+    
+    arrays = []
+    # digest : (index in arrays, sign)
+    seen = {}
+    for name, values, sign in leaves:
+        if isinstance(values, _Stored):
+            values, length = values.values, values.length
+        else:
+            values, length = np.asarray(values), None
+            if values.ndim == 1 and values.strides == (0,):
+                # broadcast constant trajectory
+                values, length = values[:1], len(values)
+        key = _digest(values, length)
+        negative_key = _digest(-values, length)
+        if seen.has_key(key):
+            index, first_sign = seen[key]
+            arrays[index][3].append((name, sign * first_sign))
+        elif seen.has_key(negative_key):
+            index, first_sign = seen[negative_key]
+            arrays[index][3].append((name, -sign * first_sign))
+        else:
+            seen[key] = (len(arrays), sign)
+            arrays.append((name, sign * values, length, []))
+    return arrays
+
+
+
+def _intern(columns):
+    """
+    Return (structures, ids) for a 2D array with a column per simulation.
+    
+    structures is a boolean array with each distinct column (nonzero = True)
+    once, sorted.  ids is the index in structures of each column.
+    """
+    
+    columns = np.asarray(columns) != 0
+    rows, cols = columns.shape
+    if cols == 0:
+        return np.zeros((rows, 0), dtype=bool), np.zeros(0, dtype=int)
+    if rows == 0:
+        return np.zeros((0, 1), dtype=bool), np.zeros(cols, dtype=int)
+    structures, ids = np.unique(columns.T, axis=0, return_inverse=True)
+    return np.ascontiguousarray(structures.T), ids
+
+
+def _compact(structures, ids):
+    """Return structures and ids without the structures that are not used"""
+    
+    used = np.unique(ids)
+    return structures[:, used], np.searchsorted(used, ids)
+
+
+def _signature(filename, checksum=False):
+    """
+    Return (size, mtime, md5) of a file.  md5 is the hex digest of the 
+    content if checksum is True, None otherwise.
+    """
+    
+    stat = os.stat(filename)
+    md5 = None
+    if checksum:
+        md5 = hashlib.md5()
+        f = open(filename, 'rb')
+        try:
+            for block in iter(lambda: f.read(2**20), ''):
+                md5.update(block)
+        finally:
+            f.close()
+        md5 = md5.hexdigest()
+    return (stat.st_size, stat.st_mtime, md5)
+
+
+def _summarize(simulation, process=None, grid=None):
+    """
+    Return a dictionary with everything that is needed to add simulation to
+    a simdex (see Simdex._add_summary()).
+    
+    This is the part of Simdex.index_one_sim() that does not touch the 
+    simdex or its h5 file, so it can run in a worker process.  The keys are:
+        - 'filename': simulation.filename
+        - 'parameters', 'parametervalues', 'variables': see 
+          Simulation.separate()
+        - 'arrays': list with (name, values, length, aliases) for each array
+          in the h5 file.  For a constant trajectory, values only contains 
+          the first value and length is the length of the trajectory, 
+          otherwise length is None.  aliases is a list with (name, sign) 
+          pairs of other names for the same array (see 
+          Simulation.get_aliases()).  All names are h5 names ('.' replaced
+          by '_dot_')
+        - 'vardic': shortname/longname pairs of the variables in the h5 file
+        - 'log': the result of analyse_log() or None if there is no log file
+    
+    process and grid: see Simdex.scan()
+    """
+    
+    simulation.separate()
+    arrays = []
+    
+    def add_array(shortname, arr, constant, aliases=[]):
+        # constant is only a hint from the name (eg. a pp line can overwrite
+        # it), the array itself decides
+        name = shortname.replace('.', '_dot_')
+        if constant and arr.ndim == 1 and len(arr) > 1 and \
+            np.all(arr == arr[0]):
+            arrays.append((name, arr[:1], len(arr), aliases))
+        else:
+            arrays.append((name, arr, None, aliases))
+    
+    if process is None:
+        # all variables, with full names.  Each column of data_2 is stored 
+        # once, under the first name of its alias group.
+        vardic = dict(zip(simulation.variables, simulation.variables))
+        groups = simulation.get_aliases()
+        constants = simulation.get_constants()
+        firsts = [group[0][0] for group in groups]
+        extracted = simulation.extract(var=dict(zip(firsts, firsts)), 
+                                       arrays = 'each', grid=grid)
+        for group in groups:
+            try:
+                arr = extracted[group[0][0]]
+            except(KeyError):
+                continue
+            aliases = [(alias.replace('.', '_dot_'), sign) 
+                       for alias, sign in group[1:]]
+            add_array(group[0][0], arr, group[0][0] in constants, aliases)
+    else:
+        extracted = simulation.postprocess(process, grid=grid)
+        constants = simulation.get_constants()
+        vardic = {}
+        for shortname, arr in extracted.iteritems():
+            name = shortname.replace('.', '_dot_')
+            ispar = process.parameters.has_key(shortname) or \
+                    process.parameters.has_key(name)
+            if not ispar:
+                try:
+                    longname = process.variables[shortname]
+                except(KeyError):
+                    longname = shortname
+                add_array(shortname, arr, longname in constants)
+                vardic[shortname] = longname
+    
+    # check if there's a log file 
+    logfilename = simulation.filename.replace('result_','dslog_')\
+                                     .replace('.mat','.txt')
+    try:
+        log = analyse_log(logfilename)
+    except(IOError):
+        print 'No %s found, log-analysis not possible' % logfilename
+        log = None
+    
+    return {'filename': simulation.filename,
+            'parameters': list(simulation.parameters),
+            'parametervalues': np.array(simulation.parametervalues),
+            'variables': list(simulation.variables),
+            'arrays': arrays,
+            'vardic': vardic,
+            'log': log}
+
+
+def _summarize_file(args):
+    """
+    Load a result file and return (index, _summarize() of it).  The summary
+    is None if the file cannot be loaded.
+    
+    args = (index, filename, variables, process, grid).  index is only 
+    passed through, this function is used by Simdex.scan, also in a pool of 
+    worker processes.
+    """
+    
+    index, filename, variables, process, grid = args
+    try:
+        sim = Simulation(filename, variables=variables)
+    except MemoryError:
+        print 'WARNING: %s could not be indexed because of a MemoryError.\nThe file is probably too big.  It could help to try in a fresh python instance' % (filename)
+        return index, None
+    except:
+        print '%s is no Dymola file.  It is not indexed' % (filename)
+        return index, None
+    return index, _summarize(sim, process, grid)
+
+
+def _summaries(jobs, workers=1):
+    """
+    Generator with the summaries of the jobs for _summarize_file, in the 
+    order of jobs.  
+    
+    If a process pool is used, the largest files are dispatched first, so 
+    that a large file at the end of the list does not determine the total 
+    time.  At most 2 * workers + 1 jobs are running or waiting to be 
+    yielded, so the summaries held in memory do not grow with the number of
+    jobs: if the next summary to yield belongs to a job that is not 
+    dispatched yet, that job is dispatched before the larger ones.
+    """
+    
+    if not use_pool(workers) or len(jobs) < 2:
+        for job in jobs:
+            yield _summarize_file(job)[1]
+        return
+    
+    sizes = []
+    for job in jobs:
+        try:
+            sizes.append(os.path.getsize(job[1]))
+        except OSError:
+            sizes.append(0)
+    order = sorted(range(len(jobs)), key=lambda i: -sizes[i])
+    
+    pool = Pool(workers)
+    try:
+        # index:AsyncResult of the jobs that are dispatched, not yet yielded
+        running = {}
+        dispatched = set()
+        pos = 0
+        for index in range(len(jobs)):
+            while pos < len(order) and len(running) < 2 * workers:
+                i = order[pos]
+                pos += 1
+                if i not in dispatched:
+                    running[i] = pool.apply_async(_summarize_file, (jobs[i],))
+                    dispatched.add(i)
+            if index not in dispatched:
+                running[index] = pool.apply_async(_summarize_file, 
+                                                  (jobs[index],))
+                dispatched.add(index)
+            yield running.pop(index).get()[1]
+    finally:
+        pool.terminate()
+        pool.join()
+
+
 def load_simdex(filename):
     """load and return a previously saved Simdex object"""
     
+    # older versions are upgraded by Simdex.__setstate__
     result = pickle.load(open(filename,'rb'))
     result.h5_path = os.path.abspath(result.h5_path)
     result.h5 = tbl.openFile(result.h5_path, 'a')
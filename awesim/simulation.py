@@ -6,8 +6,9 @@ class Simulation:
     The simualation files are supposed to be generated by Dymola, or at 
     least have the same structure.  
     A Simulation object contains all the (useful) info that is in the .mat file.
-    Therefore, objects of the Simulation class are relatively memory intensive,
-    depending on the size of the .mat file.
+    The trajectories (data_2) of a .mat file are memory-mapped: they are only
+    read from disk when they are asked for, so even very large result files
+    can be opened.
     
     Most important attributes are:
         - self.filename (path to the .mat file)
@@ -27,7 +28,6 @@ class Simulation:
 import numpy as np
 from scipy.integrate import cumtrapz
 import os
-import scipy.io
 from scipy.stats import spearmanr
 import re
 import copy
@@ -38,23 +38,184 @@ import copy
 #import tables as tbl
 #from datetime import datetime, timedelta
 import pandas
-from .utilities import make_datetimeindex, aggregate_by_time
+from .utilities import make_datetimeindex, aggregate_by_time, \
+    spearman_columns, use_pool, resample
+from . import mat4, txtresult
+from .nametree import NameTree
 import pdb
+from multiprocessing import Pool
+
+def probe(filename):
+    """
+    Return a dictionary with basic info on a result file, without loading it.
+    
+    For .mat files, only the MAT v4 headers and the first and last rows of 
+    the time column are read, so this is very fast, also for huge files.  
+    It is supposed that the time is the first column of data_2, as is always
+    the case in Dymola files.  
+    For .txt files, the declarations are parsed, and only the first and last 
+    rows of data_2 are read (see txtresult.read_header), unless its rows 
+    are not on separate lines.
+    
+    The returned dictionary contains:
+        - 'filename': the absolute path
+        - 'names': number of parameters and variables
+        - 'rows': number of rows (time points) in data_2
+        - 'columns': number of columns in data_2
+        - 'start', 'stop': first and last value of get_value('Time'), or None
+          if the time vector is empty
+    
+    An IOError is raised if filename is no Dymola result file.
+    """
+    
+    filename = os.path.abspath(filename)
+    if filename.endswith('.txt'):
+        try:
+            names, (rows, columns), time = txtresult.read_header(filename)
+            time = time[:1], time[1:]
+        except ValueError:
+            dataInfo, names, data_1, data_2 = txtresult.read_txt(filename)
+            names = len(names)
+            rows, columns = data_2.shape
+            time = data_2[:2, 0], data_2[-2:, 0]
+    else:
+        path = filename
+        if not os.path.exists(path) and os.path.exists(path + '.mat'):
+            path = path + '.mat'
+        try:
+            f = open(path, 'rb')
+            try:
+                headers = mat4.read_headers(f)
+                Aclass = mat4.read_matrix(f, headers['Aclass'])
+                transposed = ''.join(Aclass[3, :]).startswith('binTrans')
+                name = headers['name']
+                data_2 = headers['data_2']
+                if transposed:
+                    names = name.ncols
+                    columns, rows = data_2.mrows, data_2.ncols
+                    # one time point is a column in the file 
+                    step = columns * data_2.dtype.itemsize
+                else:
+                    names = name.mrows
+                    rows, columns = data_2.mrows, data_2.ncols
+                    step = data_2.dtype.itemsize
+                time = []
+                for row in [0, rows-2]:
+                    f.seek(data_2.offset + max(row, 0) * step)
+                    time.append(np.fromfile(f, dtype=data_2.dtype, count=1))
+            finally:
+                f.close()
+        except (IOError, KeyError, IndexError):
+            raise IOError('%s is no Dymola file' % (filename))
+    
+    info = {'filename':filename, 'names':names, 'rows':rows, 
+            'columns':columns, 'start':None, 'stop':None}
+    if rows > 1 and columns > 0:
+        # like get_value, we omit the last value of the time
+        info['start'] = time[0][0]
+        info['stop'] = time[1][0]
+    return info
+
+
+def _array_regex(long_name):
+    """
+    Return the regular expression for an array name with [x] (see extract)
+    """
+    
+    # first, escape the \ and ] if there is an integer between them
+    var_name = long_name.replace('[', '\[').replace(']', '\]').replace('\[x\]', '[x]')
+    
+    # alternative: with REGEX like this
+    # re.sub(r'\[(\d+)\]', r'\[\1\]', var_name)   but this is slower!             
+    # treat the array                
+    var_name = var_name.replace('[x]', '\[[0-9]*\]')
+    return var_name + '$'
+
+
+# characters that make a mother in get_objects a regular expression
+_REGEX_CHARS = re.compile(r'[\^$*+?{}\[\]\\|()]')
+# an array index in a name, eg. [12]
+_INDEX = re.compile(r'\[(\d+)\]')
+# an array index or [x] in a long_name for extract
+_INDEX_OR_X = re.compile(r'\[(\d+|x)\]')
+# number of rows of data_2 that are compared at once in get_constants()
+_CONSTANT_ROWS = 4096
+
+
+def _cputime_correlations(time, index, cpu_diff, names, values):
+    """
+    Return an array with the correlation between cpu_diff and each column of
+    values (the trajectories of names), see Simulation.analyse_cputime()
+    """
+    
+    # columns with a name ending with Int are supposed to be cumulative
+    cumulative = np.array([name.endswith('Int') or name == 'CPUtime' 
+                           for name in names], dtype=bool)
+    diffs = np.empty((len(index) - 1, len(names)))
+    try:
+        if cumulative.any():
+            diffs[:, cumulative] = np.diff(values[index][:, cumulative], axis=0)
+        if not cumulative.all():
+            var_cum = cumtrapz(values[:, ~cumulative], time, axis=0)
+            diffs[:, ~cumulative] = np.diff(var_cum[index], axis=0)
+    except(IndexError):
+        print "====================== ERROR ====================="
+        print "This IndexError can be caused by a wrong interval."
+        print "Make sure the simulation has this output interval."
+        raise
+    
+    return spearman_columns(diffs, cpu_diff)
+
+
+def _cputime_chunk(args):
+    """
+    Worker for Simulation.analyse_cputime with a process pool.
+    
+    args = (filename, names, interval).  Only the columns of names are 
+    loaded from the file.  Returns the correlations for names.
+    """
+    
+    filename, names, interval = args
+    sim = Simulation(filename, variables=list(names) + ['CPUtime'])
+    time, index, cpu_diff = sim._sample_cputime(interval)
+    return _cputime_correlations(time, index, cpu_diff, names, 
+                                 sim.get_values(names))
+
+
+def _load_one(args):
+    """
+    Worker for Simulation.load_many.
+    
+    args = (filename, var, arrays).  Only the columns needed for var are 
+    read from the file.  Returns (filename, extracted) with extracted the
+    dictionary returned by extract(), or None if the file could not be read.
+    The Simulation object itself is never sent back, only the numpy arrays.
+    """
+    
+    filename, var, arrays = args
+    try:
+        sim = Simulation(filename, variables=var.values())
+    except (IOError, MemoryError):
+        return filename, None
+    return filename, sim.extract(var, arrays=arrays)
+
 
 class Simulation:
     """
     Class for doing operations one single simulation file
     The simulation files can be .mat files or .txt files. 
     A Simulation object contains all the (useful) info that is in the file.  
-    Therefore, objects of the Simulation class are relatively memory intensive,
-    depending on the size of the result file.
+    For .mat files, the trajectories (data_2) are memory-mapped and only read
+    from disk when needed.  Objects created from .txt files keep everything
+    in memory.
     
     Most important attributes are:
         - self.filename (path to the result file)
         - self.names (list of all variable and parameter names)
         - self.dataInfo (mapping of vars and pars to data1 and data2)
         - self.data1 (contains the values of the parameters)
-        - self.data2 (contains the values of the variables (timeseries))
+        - self.data2 (contains the values of the variables (timeseries), 
+          as a read-only numpy.memmap for .mat files)
     
     Most important methods are:
         - get_value(name) : retreives the value(s) for name, name can be 
@@ -63,143 +224,78 @@ class Simulation:
     
     """
     
-    def __init__(self, filename, verbose = False):
+    def __init__(self, filename, verbose = False, variables=None):
         ''' 
         Create a Simulation object from a result file
         The filename can be an absolute path, or a filename in the current work
         directory.  If the filename has no extension, it is supposed to 
         be a .mat file.
+        
+        variables (optional) is a list with the (long) names of the variables
+        that are needed.  Array variables can be given with [x] like in 
+        extract().  If variables is given, only the trajectories of these 
+        variables and Time are read from data_2, the rest of data_2 is never
+        touched.  get_value() raises a ValueError for the other variables.
+        All names and parameters remain available.
         '''
         
         self.verbose = verbose        
         # turn filename in an absolute path
-        # no .mat extension needed, it is added by the scipy.io.loadmat method
+        # no .mat extension needed, it is added if the file is not found
         if filename.endswith('.txt'):
-            
-            def parse_dataInfo(dataInfo, names, s):
-                """return dataInfo and names with info from s added"""
-                
-                row = np.fromstring(s.split('#')[0], dtype=int, sep=' ')
-                if dataInfo == None:
-                    dataInfo = row
-                else:
-                    dataInfo = np.row_stack((dataInfo, row))
-                    
-                name = s.split('# ')[-1].strip()
-                if names == None:
-                    names = [name]
-                else:
-                    names.append(name)
-                
-                return dataInfo, names
-            
-            def parse_data_1_2(data, s, row, col):
-                """data is the array we want to fill with values from s
-                We keep track of the last filled element:
-                    row, col is where the next one should come
-                """
-                
-                to_add = np.fromstring(s, sep=' ')
-                places_in_current_row = data.shape[1] - col
-                if len(to_add) < places_in_current_row :
-                    data[row, col:col+len(to_add)] = to_add
-                    col += len(to_add)
-                elif len(to_add) == places_in_current_row :
-                    data[row, col:col+len(to_add)] = to_add
-                    row += 1
-                    col = 0
-                else:
-                    raise ValueError("Godverdomme, knoeiers")
-                
-                # final check
-                if row > data.shape[0] and col == 0:
-                    print 'The array is filled up to the last element'
-                return data, row, col
-
-            # read a .txt file
+            # read a .txt file, in large chunks
             filename = os.path.abspath(filename)
-            f = file(filename, 'r')
-            lines = f.readlines()
-            
-            dataInfo, names = None, None
-            # we cycle of the lines only once
-            dataInfo_active, data_1_active, data_2_active = False, False, False
-            for i,l in enumerate(lines):
-                if np.mod(i, 10000) == 0:
-                    print 'line = ', i
-                # we use the fact that we'll first find dataInfo, then
-                # data_1, and finally data_2
-                if l.find('dataInfo') > -1 and not l.startswith('#'):
-                    dataInfo_active = True                    
-                    start = i+1
-                    stop = start + int(l.split('(')[-1].split(',')[0])
-                elif l.find('data_1') > -1 and not l.startswith('#'):
-                    dataInfo_active = False
-                    data_1_active = True                    
-                    start = i+1
-                    shape_string = l.split('data_1(')[-1].strip().rstrip(')') # x,y as string
-                    shape_1 = eval(shape_string)
-                    data_1 = np.ndarray(shape_1)
-                    row,col=0,0
-                elif l.find('data_2') > -1 and not l.startswith('#'):
-                    data_1_active = False
-                    data_2_active = True                    
-                    start = i+1
-                    shape_string = l.split('data_2(')[-1].strip().rstrip(')') # x,y as string
-                    shape_2= eval(shape_string)
-                    data_2 = np.ndarray(shape_2)
-                    row,col=0,0
-                # parse the line if needed
-                if dataInfo_active and start <= i < stop:
-                    dataInfo, names = parse_dataInfo(dataInfo, names, l)
-                elif data_1_active and start <= i:
-                    if len(l.strip()) > 0:
-                        data_1, row, col = parse_data_1_2(data_1, l, row, col)
-                    else:
-                        # we are in the white line between data_1 and _2
-                        pass                            
-                elif data_2_active and start <= i:
-                    if len(l.strip()) > 0:
-                        data_2, row, col = parse_data_1_2(data_2, l, row, col)
-                    else:
-                        # we are in the white line between data_1 and _2
-                        pass 
-                    
+            if verbose:
+                def progress(name, rows_read, rows):
+                    print '%s: %d of %d rows read' % (name, rows_read, rows)
+            else:
+                progress = None
+            dataInfo, names, data_1, data_2 = txtresult.read_txt(filename, 
+                                                                 progress)
                     
         else:
-            # read a .mat file            
+            # read a .mat file.  Only the headers are parsed, data_2 is 
+            # memory-mapped so that only the columns that are asked for are
+            # ever read from disk.
             filename = os.path.abspath(filename)
+            path = filename
+            if not os.path.exists(path) and os.path.exists(path + '.mat'):
+                path = path + '.mat'
                     
+            # check the matrices in the file to make sure we're having a 
+            # dymola file        
             try:
-                d = scipy.io.loadmat(filename, chars_as_strings = False)
-                # if all goes well, d is a dictionary 
-                
-            except(UnicodeDecodeError):
-                print 'This error is caused by non-ascii characters in the .mat file\
-                 like °C'
-                print 'Modify the scipy.io.mio4.py file by adding ,"replace" in the\
-                 line that causes the error'
-                raise
-            
-            # check the fields of d to make sure we're having a dymola file        
-            try:
-                # here we create numpy arrays with names dataInfo, name, 
-                # data_1 and data_2
-                dataInfo = d['dataInfo'].transpose()
-                name = d['name'].transpose()
-                data_1 = d['data_1'].transpose()
-                data_2 = d['data_2'].transpose()
-                  
-            except :
+                f = open(path, 'rb')
+                try:
+                    headers = mat4.read_headers(f)
+                    # Dymola writes the matrices either transposed 
+                    # ('binTrans', default) or not ('binNormal')
+                    Aclass = mat4.read_matrix(f, headers['Aclass'])
+                    transposed = ''.join(Aclass[3, :]).startswith('binTrans')
+                    # here we create numpy arrays with names dataInfo, name, 
+                    # data_1 and data_2
+                    dataInfo = mat4.read_matrix(f, headers['dataInfo'])
+                    name = mat4.read_matrix(f, headers['name'])
+                    data_1 = mat4.read_matrix(f, headers['data_1'])
+                finally:
+                    f.close()
+                data_2 = mat4.memmap_matrix(path, headers['data_2'])
+            except (IOError, KeyError, IndexError):
                 print '%s is no Dymola file.  No Simulation object created' % \
                     (filename)
-                raise IOError
+                raise IOError('%s is no Dymola file' % (filename))
+            
+            if transposed:
+                dataInfo = dataInfo.transpose()
+                name = name.transpose()
+                data_1 = data_1.transpose()
+                data_2 = data_2.transpose()
 
-            names = [] 
-            # names will be list with names of all parameters and variables 
-                   
-            for i in range(name.shape[0]):
-                names.append(''.join(name[i, :]).strip())  
+            # names will be list with names of all parameters and variables.
+            # Each row of name is converted to a single string at once
+            name = np.ascontiguousarray(name)
+            names = name.view('S%d' % (name.shape[1])).reshape(name.shape[0])
+            names = np.char.strip(names, ' \x00').tolist()
             
         # Now we have dataInfo, data_1 and data_2 from the first Dymola file
 
@@ -241,7 +337,28 @@ class Simulation:
         self.data_1 = data_1
         self.data_2 = data_2
         self.filename = filename
+        # mapping of the columns of data_2 in the file to the columns of 
+        # self.data_2 (-1 = not loaded).  None means all columns are present.
+        self._columns = None
+        # NameTree of self.names, built on first use of exist or get_objects
+        self._tree = None
+        # array families, see _array_names().  Built on first use.
+        self._families = None
+        # cache with long_name:(matrix, columns, signs) for arrays in extract
+        self._arrays = {}
+        # interpolation and extrapolation of each column of data_2, see 
+        # _resample().  Built on first use.
+        self._modes = None
+        # alias groups of the variables, see get_aliases().  Built on first use.
+        self._aliases = None
+        # names of the constant variables, see get_constants()
+        self._constants = None
+        if variables is not None:
+            self._load_selection(variables)
+        self._build_index()
         
+        # (names, dataInfo, data_1) of the last separate()
+        self._separated = None
         self.separate()
         
         print '{} loaded.'.format(filename)
@@ -255,6 +372,287 @@ class Simulation:
         return len(self.simulations)
 
 
+    def _load_selection(self, variables):
+        """
+        Keep only the columns of data_2 needed for variables (and Time).
+        
+        The selected columns are read into memory in a single pass and replace
+        self.data_2.  self._columns is set to map the original column numbers
+        to the columns in the new self.data_2.
+        """
+        
+        wanted = set()
+        for long_name in variables:
+            if long_name.find('[x]') > -1:
+                wanted.update(self._array_names(long_name))
+            else:
+                wanted.add(long_name)
+        
+        columns = set()
+        for i, name in enumerate(self.names):
+            if self.dataInfo[i, 0] == 0 or (self.dataInfo[i, 0] == 2 and \
+                name in wanted):
+                columns.add(abs(self.dataInfo[i, 1]) - 1)
+        
+        columns = np.array(sorted(columns), dtype=int)
+        self._columns = -np.ones(self.data_2.shape[1], dtype=int)
+        self._columns[columns] = np.arange(len(columns))
+        self.data_2 = np.array(self.data_2[:, columns])
+
+    def _build_index(self):
+        """
+        Build self._index, a dictionary with name:(matrix, column, sign) 
+        
+        matrix is 1 for parameters (data_1) and 2 for variables (data_2), 
+        column is the column in self.data_1 or self.data_2 (starting from 0,
+        -1 if the variable is not loaded) and sign is +1 or -1.
+        """
+        
+        matrices = self.dataInfo[:, 0].copy()
+        # dataInfo[0, 0] = 0: the abscissa (Time) is found in data_2
+        matrices[matrices == 0] = 2
+        columns = np.abs(self.dataInfo[:, 1]) - 1
+        signs = np.sign(self.dataInfo[:, 1])
+        if self._columns is not None:
+            in_data_2 = matrices == 2
+            columns[in_data_2] = self._columns[columns[in_data_2]]
+        
+        # reversed, so the first occurence of a name wins (like list.index)
+        self._index = dict(zip(reversed(self.names), 
+                               reversed(zip(matrices.tolist(), 
+                                            columns.tolist(), 
+                                            list(signs)))))
+
+    def _lookup(self, name):
+        """Return (matrix, column, sign) for name, raise ValueError if needed"""
+        
+        try:
+            matrix, column, sign = self._index[name]
+        except (KeyError):
+            print '%s not found in %s' % (name, self.filename)
+            print 'Did you mean one of the following: '
+            print self.exist(name)
+            raise ValueError('%s not found in %s' % (name, self.filename))
+        
+        if matrix not in (1, 2):
+            raise ValueError('name not found')
+        if column < 0:
+            raise ValueError('%s is not loaded from %s' % (name, self.filename))
+        return matrix, column, sign
+
+    def _array_names(self, long_name):
+        """
+        Return the names of all elements of an array name with [x]
+        
+        All names with array indices are grouped in families, with all indices
+        replaced by [x] (eg. 'c[x].T' for 'c[1].T', 'c[2].T', ...).  The 
+        families are built once.  Like the regular expression of 
+        _array_regex(), the family of long_name is matched not case sensitive
+        and at the end of the families (so 'c[x].T' also finds 'a.c[1].T'), 
+        and the names are returned in the order of self.names.  Indices that 
+        are given in long_name (eg. 'c[x].port[2].T') have to match.
+        
+        If no family matches, the names are sought with the regular 
+        expression, see _array_regex().
+        """
+        
+        if self._families is None:
+            families = {}
+            for position, name in enumerate(self.names):
+                if name.find('[') > -1:
+                    indices = _INDEX.findall(name)
+                    if len(indices) > 0:
+                        family = _INDEX.sub('[x]', name).lower()
+                        families.setdefault(family, []).append(
+                            (position, tuple([int(i) for i in indices]), 
+                             name))
+            self._families = families
+        
+        query = _INDEX.sub('[x]', long_name).lower()
+        given = _INDEX_OR_X.findall(long_name)
+        # positions of the given indices, counted from the end
+        fixed = [(position - len(given), int(index)) for position, index in 
+                 enumerate(given) if index != 'x']
+        members = []
+        for family, candidates in self._families.iteritems():
+            if family.endswith(query):
+                members.extend(candidates)
+        members.sort()
+        names = [name for position, indices, name in members 
+                 if all([indices[i] == index for i, index in fixed])]
+        if len(names) == 0:
+            names = self.exist(_array_regex(long_name))
+        return names
+
+    def _array_columns(self, long_name):
+        """
+        Return (matrix, columns, signs) for the elements of long_name with [x]
+        
+        The result is cached.  A ValueError is raised if no elements are 
+        found, or if they are not all parameters or all variables.
+        """
+        
+        try:
+            return self._arrays[long_name]
+        except KeyError:
+            pass
+        
+        names = self._array_names(long_name)
+        if len(names) == 0:
+            raise ValueError('no array found for ' + long_name)
+        found = [self._lookup(name) for name in names]
+        matrices = set([matrix for matrix, column, sign in found])
+        if len(matrices) > 1:
+            raise ValueError('%s mixes parameters and variables' % (long_name))
+        columns = np.array([column for matrix, column, sign in found])
+        signs = np.array([sign for matrix, column, sign in found])
+        self._arrays[long_name] = (matrices.pop(), columns, signs)
+        return self._arrays[long_name]
+
+    def _reduce_array(self, matrix, columns, signs, arrays):
+        """
+        Return the values of array elements, combined according to arrays
+        
+        For 'sum' and 'mean' of variables, the columns are accumulated one by 
+        one, or reduced in a single strided view if they are equally spaced,
+        so no 2D copy of the values is made.
+        """
+        
+        if arrays not in ('sum', 'mean', 'each'):
+            raise NotImplementedError('arrays='+arrays+' is an unvalid argument')
+        
+        if matrix == 1:
+            array = self.data_1[:1, columns] * signs
+            if len(columns) == 1:
+                return array[:, 0]
+            elif arrays == 'each':
+                return array
+            total = array.sum(axis=1)
+        else:
+            data = self.data_2[:-1]
+            signs = signs.astype(data.dtype)
+            if len(columns) == 1:
+                return data[:, columns[0]] * signs[0]
+            elif arrays == 'each':
+                return data[:, columns] * signs
+            
+            step = columns[1] - columns[0]
+            if step > 0 and np.all(np.diff(columns) == step) and \
+                np.all(signs == 1):
+                total = data[:, columns[0]:columns[-1]+1:step].sum(axis=1)
+            else:
+                total = data[:, columns[0]] * signs[0]
+                for column, sign in zip(columns[1:], signs[1:]):
+                    if sign > 0:
+                        total += data[:, column]
+                    else:
+                        total -= data[:, column]
+        
+        if arrays == 'mean':
+            total /= len(columns)
+        return total
+
+    def _resample(self, column, values, grid, time):
+        """
+        Return values resampled on grid, with the interpolation and 
+        extrapolation from dataInfo for column (a column of self.data_2).
+        time is the time vector of values (see get_value('Time')).
+        """
+        
+        if self._modes is None:
+            rows = self.dataInfo[:, 0] == 2
+            columns = np.abs(self.dataInfo[rows, 1]) - 1
+            if self._columns is not None:
+                columns = self._columns[columns]
+            self._modes = dict(zip(columns.tolist(), 
+                                   [tuple(m) for m in 
+                                    self.dataInfo[rows, 2:4].tolist()]))
+        interpolation, extrapolation = self._modes.get(column, (0, 0))
+        return resample(time, values, grid, interpolation, extrapolation)
+
+    def get_aliases(self):
+        """
+        Return a list with the alias groups of the variables.
+        
+        In a Dymola file, many variables are stored in the same column of 
+        data_2, possibly with the opposite sign (see dataInfo[:, 1]).  Each
+        group is a sorted list of (name, sign) tuples for all variables in 
+        one column.  sign is +1 or -1, relative to the first name of the 
+        group: get_value(name) == sign * get_value(group[0][0]).
+        The groups are sorted on their first name.  Variables that are not 
+        loaded (see __init__) are left out.
+        
+        The groups are computed once, for all variables at the same time.
+        """
+        
+        if self._aliases is not None:
+            return self._aliases
+        
+        kind = self.dataInfo[:, 0]
+        rows = np.nonzero((kind == 2) | (kind == 0))[0]
+        columns = np.abs(self.dataInfo[rows, 1]) - 1
+        if self._columns is not None:
+            columns = self._columns[columns]
+        rows, columns = rows[columns >= 0], columns[columns >= 0]
+        if len(rows) == 0:
+            self._aliases = []
+            return self._aliases
+        
+        names = np.array(self.names)[rows]
+        signs = np.sign(self.dataInfo[rows, 1])
+        # sorted on column, and on name within each column
+        order = np.lexsort((names, columns))
+        names, columns, signs = names[order], columns[order], signs[order]
+        new_group = np.ones(len(columns), dtype=bool)
+        new_group[1:] = columns[1:] != columns[:-1]
+        # sign of each name relative to the first name of its group
+        firsts = np.nonzero(new_group)[0]
+        signs = signs * signs[firsts][np.cumsum(new_group) - 1]
+        
+        aliases = zip(names.tolist(), signs.tolist())
+        bounds = firsts.tolist() + [len(aliases)]
+        groups = [aliases[start:stop] for start, stop in zip(bounds[:-1], 
+                                                             bounds[1:])]
+        groups.sort()
+        self._aliases = groups
+        return groups
+
+    def get_constants(self):
+        """
+        Return a set with the names of the variables that are constant over
+        the whole simulation.
+        
+        All columns of data_2 are compared with their first row at the same
+        time, in blocks of rows to limit the memory use for large files.  
+        Columns that differ in a block are not read anymore in the next 
+        blocks.  Variables that are not loaded (see __init__) are left out.
+        The result is computed once.
+        """
+        
+        if self._constants is not None:
+            return self._constants
+        
+        # like get_value(), the last row is omitted
+        rows = self.data_2.shape[0] - 1
+        first = np.array(self.data_2[:1])
+        constant = np.ones(self.data_2.shape[1], dtype=bool)
+        for start in range(1, rows, _CONSTANT_ROWS):
+            candidates = np.nonzero(constant)[0]
+            if len(candidates) == 0:
+                break
+            block = self.data_2[start:min(start + _CONSTANT_ROWS, rows)]
+            constant[candidates] = np.all(block[:, candidates] == 
+                                          first[:, candidates], axis=0)
+        
+        kind = self.dataInfo[:, 0]
+        rows = np.nonzero((kind == 2) | (kind == 0))[0]
+        columns = np.abs(self.dataInfo[rows, 1]) - 1
+        if self._columns is not None:
+            columns = self._columns[columns]
+        rows = rows[(columns >= 0) & constant[columns]]
+        self._constants = set([self.names[i] for i in rows])
+        return self._constants
+
     def get_value(self, name):
         '''
         get_value(self, name)
@@ -262,35 +660,43 @@ class Simulation:
         This function returns a numpy array with the value(s) of 'name' 
         '''
         
-        result = []
-        try:
-            name_index = self.names.index(name)
-        except (ValueError):
-            print '%s not found in %s' % (name, self.filename)
-            print 'Did you mean one of the following: '
-            print self.exist(name)
-            raise
-            
-        possign = self.dataInfo[name_index, 1]
-        pos = abs(possign)
-        #pos is the row number in data_1 or data_2
-        sign = np.sign(possign)
-        #sign indicates the sign of the values 
-        if self.dataInfo[name_index, 0] == 1:
-            source = 'self.data_1'
+        matrix, column, sign = self._lookup(name)
+        if matrix == 1:
             # it is a parameter, found in data_1
-            stringske = "result=" + source + "[:,pos-1][0]*sign"
-        elif self.dataInfo[name_index, 0] == 2 or \
-            self.dataInfo[name_index, 0] == 0:
-            source = 'self.data_2'
+            return self.data_1[0, column] * sign
+        else:
             # important: by testing I found out that get_value for variables
             # gives the last value 2 times.  So I omit the last value here.
-            stringske = "result=" + source + "[:-1, pos-1]*sign"
-        else:
-            raise ValueError('name not found')
+            return self.data_2[:-1, column] * sign
+
+    def get_values(self, names):
+        """
+        Return a 2D array with the values of names as columns
         
-        exec(stringske)
-        return result
+        All names have to be variables, or all names have to be parameters.
+        For variables, the array has the same length as get_value('Time'), 
+        for parameters, the array has a single row.  
+        
+        The values are taken from data_1 or data_2 with a single slice, so 
+        this is much faster than calling get_value() for each name.
+        A ValueError is raised if any of the names is not found.
+        """
+        
+        matrices, columns, signs = [], [], []
+        for name in names:
+            matrix, column, sign = self._lookup(name)
+            matrices.append(matrix)
+            columns.append(column)
+            signs.append(sign)
+        
+        signs = np.array(signs)
+        if 1 in matrices:
+            if 2 in matrices:
+                raise ValueError('get_values() cannot mix parameters and variables')
+            return self.data_1[:1, columns] * signs
+        else:
+            # keep the precision of data_2, like get_value() does
+            return self.data_2[:-1, columns] * signs.astype(self.data_2.dtype)
         
     def exist(self, regex): 
         """
@@ -306,17 +712,37 @@ class Simulation:
         escape the [ and ] with a backlslash, like this:
         self.exist('c\[3\].T). Otherwise c3.T is sought for. This is 
         because in regex syntax, [] is used to indicate a set of characters.
+        To look up names in the model hierarchy, children() and find() are
+        faster.
                 
         """
         
-        p = re.compile(regex, re.IGNORECASE)
-        matches = []
-        for i in range(0, len(self.names)):
-            m = p.search(self.names[i])
-            if m:
-                matches.append(self.names[i])
+        return self._get_tree().search(regex)
+
+    def children(self, path=''):
+        """
+        Return a sorted list with the components directly below path, a 
+        dotted model name like 'c[1].heatPort'.  path = '' gives the top 
+        level objects.  See nametree.NameTree.children()
+        """
+        
+        return self._get_tree().children(path)
+
+    def find(self, pattern):
+        """
+        Return a sorted list with the names matching pattern, a dotted name
+        with wildcards per component, eg. 'c*.heatPort.*'.  
+        See nametree.NameTree.find()
+        """
         
-        return matches
+        return self._get_tree().find(pattern)
+
+    def _get_tree(self):
+        '''Return the NameTree of self.names, it is built on first use'''
+        
+        if self._tree is None:
+            self._tree = NameTree(self.names)
+        return self._tree
 
     def separate(self):
         '''
@@ -328,51 +754,40 @@ class Simulation:
             - list variables (sorted)
             - numpy array parametervalues 
         This method returns True if successfull
+        
+        The separation is done only once, the next calls return immediately
+        as long as names, dataInfo and data_1 are not replaced.
         '''
-        # We create a loop over each of the elements in names, check if it is 
-        # parameter or variable. We update the attributes parameters and 
-        # variables, and if it is a parameter, we put the value in 
-        # parametermap
-    
-        parameters = []
-        variables = []
-        parametervalues = []
-        # parametervalues is a list with the values of the parametes for this
-        # run.  Will be converted to array and become self.parametervalues
-        
-        for i in range(len(self.names)):
-            par_or_var = self.names[i] #string with the name of the par or var
-            
-            possign = self.dataInfo[i, 1]
-            pos = abs(possign)
-            #pos is the row number in data_1 or data_2
-            sign = np.sign(possign)
-            #sign indicates the sign of the values 
-    
-            if self.dataInfo[i, 0] == 1:
-                # par_or_var is a parameter
-                parameters.append(par_or_var)
-                parametervalues.append(self.data_1[0, pos-1] * sign)
-    
-            elif self.dataInfo[i, 0] == 2 or self.dataInfo[i, 0] == 0:
-                # par_or_var is a variable (if == 0: time)
-                variables.append(par_or_var)
-            
-            else:
-                print par_or_var
-                raise LookupError('Couldnt find this value in dataInfo')
-            
         
-        zipped = zip(parameters, parametervalues)
-        zipped.sort()
-        self.parametervalues = np.array([v for p,v in zipped]) 
-        self.parameters = [p for p,v in zipped]
-        self.variables = variables
-        self.variables.sort()
+        source = (self.names, self.dataInfo, self.data_1)
+        if self._separated is not None and \
+            all([a is b for a, b in zip(self._separated, source)]):
+            return True
+        
+        # parameters are found in data_1 (dataInfo[:, 0] == 1), variables 
+        # in data_2 (== 2) or it is the time (== 0)
+        kind = self.dataInfo[:, 0]
+        is_par = kind == 1
+        is_var = (kind == 2) | (kind == 0)
+        if not np.all(is_par | is_var):
+            print self.names[np.nonzero(~(is_par | is_var))[0][0]]
+            raise LookupError('Couldnt find this value in dataInfo')
+        
+        names = np.array(self.names)
+        
+        par_index = np.nonzero(is_par)[0]
+        par_index = par_index[np.argsort(names[par_index], kind='mergesort')]
+        possign = self.dataInfo[par_index, 1]
+        #pos is the row number in data_1, sign the sign of the values 
+        self.parametervalues = self.data_1[0, np.abs(possign)-1] * \
+                               np.sign(possign)
+        self.parameters = names[par_index].tolist()
+        self.variables = np.sort(names[is_var]).tolist()
         
+        self._separated = source
         return True
 
-    def extract(self, var, arrays='sum'):
+    def extract(self, var, arrays='sum', grid=None):
         """Return dictionary with values of the variables/parameters to extract
         
         This method takes a dictionary as input with short_name/full_name pairs.
@@ -387,12 +802,17 @@ class Simulation:
             - All values for all present 'x' will be extracted
             - argument arrays defines what happens with these values:
                 - arrays='sum' (default): returns the sum of all values
-                - arrays='average' returns the average of all values
+                - arrays='mean' returns the average of all values
                 - arrays='each' : returns an array with all the values
             - Attention, the array argument defines the action for ALL arrays.
         
         If a long_name is not found, the method passes on, no exception raised!
         
+        grid (optional) is an array with times in seconds.  If given, all 
+        trajectories are resampled on this grid with the interpolation and 
+        extrapolation defined in dataInfo (see utilities.resample()), and 
+        Time is replaced by the grid.  Parameters are not changed.
+        
         First version 20110831, RDC
         
         20111123 - raise no exception if a variable is not found
@@ -401,39 +821,27 @@ class Simulation:
         """
         
         #pdb.set_trace()
-                
+        
+        if grid is not None:
+            time = self.get_value('Time')
+            grid = np.asarray(grid)
+        
         r = {}
         for short_name in var:        
             long_name = var[short_name]
             # check for array first            
             if long_name.find('[x]') > -1:
-                # first, escape the \ and ] if there is an integer between them
-                var_name = long_name.replace('[', '\[').replace(']', '\]').replace('\[x\]', '[x]')
-                
-                # alternative: with REGEX like this
-                # re.sub(r'\[(\d+)\]', r'\[\1\]', var_name)   but this is slower!             
-                # treat the array                
-                var_name = var_name.replace('[x]', '\[[0-9]*\]')
-                var_name = var_name + '$'
-                # we make a list of all present array variables                    
-                array_vars = self.exist(var_name)
-                # we put all values in an array, as columns
+                # the columns of all present array elements, cached
                 try:
-                    array = self.get_value(array_vars[0])
-                except(ValueError, IndexError):
+                    matrix, columns, signs = self._array_columns(long_name)
+                except(ValueError):
                     # The array was not found: just pass to the next
                     pass
                 else:
-                    for v in array_vars[1:]:
-                        array = np.column_stack((array, self.get_value(v)))                    
-                    if arrays == 'sum':
-                        r[short_name] = array.sum(axis=1)
-                    elif arrays == 'mean':
-                        r[short_name] = array.mean(axis=1)
-                    elif arrays == 'each':
-                        r[short_name] = array
-                    else:
-                        raise NotImplementedError('arrays='+arrays+' is an unvalid argument')    
+                    value = self._reduce_array(matrix, columns, signs, arrays)
+                    if grid is not None and matrix == 2:
+                        value = self._resample(columns[0], value, grid, time)
+                    r[short_name] = value
             else: 
                 # the variable is NO array
                 try:
@@ -442,6 +850,12 @@ class Simulation:
                     # the variable is not found.  No problem, pass to the next.                    
                     pass
                 else:
+                    if grid is not None:
+                        matrix, column = self._index[long_name][:2]
+                        if long_name == 'Time':
+                            value = grid.astype(value.dtype)
+                        elif matrix == 2:
+                            value = self._resample(column, value, grid, time)
                     if not isinstance(value, np.ndarray):
                         r[short_name] = np.array(value, ndmin=1)
                     else:
@@ -458,54 +872,56 @@ class Simulation:
         If no mother model is specified, this method gets all the main objects, 
         except 'Time'.
         
-        If needed, speed can be improved by using sorted lists 
-        Doesn't work with arrays yet (to do that, excape the [ and ] 
-        in the mother name)
+        A mother that is a path in the model hierarchy, or that has no 
+        special regex characters, is looked up in the name tree (see 
+        children()), not case sensitive.  Array indices can be used, eg. 
+        'foo.c[2]'.  Otherwise, the mother is a regular expression, not case
+        sensitive, that can match anywhere in a name (see exist()), eg. 
+        'c[12]' for the objects of both c1 and c2.
         
         First version: 20110906, RDC        
         
         """
         
-        try:
-            test = self.variables
-        except AttributeError:
-            self.separate()
-        
-        objects = []
-        if mother == '':
-            search_in = copy.copy(self.variables)
-            search_in.extend(self.parameters)
-            search_in.remove('Time')
-            try:
-                search_in.remove('stateSelect')
-            except ValueError:
-                pass
-            index = 0
+        tree = self._get_tree()
+        if mother == '' or tree.exists(mother) or \
+            _REGEX_CHARS.search(mother) is None:
+            objects = tree.children(mother)
+            if mother == '':
+                objects = [o for o in objects if o != 'Time']
         else:
             # make the list with all variables and parameters in the mother model 
             mother_dot = mother + '.'            
-            search_in = self.exist(mother_dot)
             index = mother_dot.count('.')
-            
-        for v in search_in:    
-            potential_model = v.split('.')[index]
-            try:
-                objects.index(potential_model)
-            except ValueError:
-                objects.append(potential_model)
+            objects = []
+            found = set()
+            for v in self.exist(mother_dot):    
+                potential_model = v.split('.')[index]
+                if potential_model not in found:
+                    found.add(potential_model)
+                    objects.append(potential_model)
         try:
             objects.remove('stateSelect')
         except ValueError:
             pass
-                   
         
         return objects
 
 
-    def postprocess(self, process):
+    def postprocess(self, process, outputs=None, grid=None):
         """
         Return a dictionary with results as defined in process
         
+        outputs (optional) is a list with the short names to return (Time 
+        is always returned).  If None, process.outputs is used and if that is
+        None too, all variables, parameters and pp results are returned.  
+        When outputs are given, only the variables and parameters needed to
+        compute them are extracted (see Process.get_requirements()).
+        
+        grid (optional): array with times in seconds.  If given, all 
+        trajectories are resampled on this grid before the pp strings are 
+        evaluated, see extract().
+        
         A difference is made between single line assignments (x = ...) 
         and multiline statements (if ...).  
         Therefore, the pp string can be multiline,
@@ -528,98 +944,112 @@ class Simulation:
                 
         the multline thing is not implemented yet.
         
+        The pp strings are parsed and compiled only once, by 
+        process.get_plan().  The plan is cached on the process and reused 
+        for every simulation that is postprocessed with it.
+        
+        The datetime index dt_index is only created if a pp string uses it.
+        
         """
         
-        def convert(string):
+        def convert(line, mothers):
             """
             Return a dictionary with shortname/value pairs 
-            as result of a single postprocessing line string
+            as result of a single compiled postprocessing line (PPLine)
             """
 
-            #pdb.set_trace()
-            
             returndic = {}
-            splitted = string.split(' ')
-            # First check if we need to loop over the mothers
-            apply_on_mothers = False
-            for i in splitted:
-                # now we will treat each part of the string individually
-                if process.sub_vars.has_key(i) or process.sub_pars.has_key(i):
-                    apply_on_mothers = True
-                    break
-            
-            # Now process the string            
-            if not apply_on_mothers:
-                # evaluate the string, and by passing the result dictionary 
+            if not line.on_mothers:
+                # evaluate the code, and by passing the result dictionary 
                 # as locals, the variables are known                
-                returndic[splitted[0]] = eval(' '.join(splitted[2:]), globals(), result)
+                returndic[line.target] = line.evaluate(result, globals(), 
+                                                       engine=engine)
             else:
-                # we need to find all variables and add the mothers to them
-                for m in process.mothers:    
-                    composed = []
-                    newvar = '_'.join([m,splitted[0]]).replace('.','_')
-                    for s in splitted[2:]:
-                        fullname = '_'.join([m,s]).replace('.','_')
-                        #print fullname
-                        if result.has_key(fullname):
-                            # a variable we need to get
-                            composed.append(fullname)
-                        else:
-                            """ 
-                            There are different possibilities. 
-                            - it is an operation (like +, -, /, ...) ==> append to composed
-                            - it is a command (like np.trapz(var) ==> not yet implmented
-                            - it is a variable that does not occur in this simulation:
-                                appending it to composed will lead to a name error
-                                because it is not present in the result dict.  
-                                For now, we just catch the error and print a warning
-                            """                            
-                            composed.append(s)
-                    #print 'composed string: ', newvar, ' = ', ' '.join(composed)
+                # the mother_name is used for all names that are present
+                for newvar, candidates in mothers:
+                    substitutions = tuple([c for c in candidates 
+                                           if result.has_key(c[1])])
                     try:
-                        returndic[newvar] = eval(' '.join(composed), globals(), result)
+                        returndic[newvar] = line.evaluate(result, globals(), 
+                                                          substitutions, engine)
                     except(NameError) as e:
+                        # a variable that does not occur in this simulation
                         print 'This pp string could not be evaluated:'
-                        print newvar, ' = ', ' '.join(composed)
+                        print newvar, ' = ', line.expression(substitutions)
                         print 'Error message =  %s' % e
                     except:
                         print 'Error during this evaluation:'
-                        print newvar, ' = ', ' '.join(composed)
+                        print newvar, ' = ', line.expression(substitutions)
                         raise
-                 
-                # To ensure that the newly created var can be used later on:
-                process.sub_vars[splitted[0]] = splitted[0]
 
             return returndic
             
-  
-
-
-        
+        if outputs is None:
+            outputs = getattr(process, 'outputs', None)
         vars_and_pars = {}
         vars_and_pars.update(process.variables)
         vars_and_pars.update(process.parameters)
-        result = self.extract(vars_and_pars, arrays='each')
+        if outputs is None:
+            steps = [(line, line.mothers) for line in process.get_plan()]
+        else:
+            names, steps = process.get_requirements(outputs)
+            names.add('Time')
+            vars_and_pars = dict([(k, v) for k, v in vars_and_pars.iteritems()
+                                  if k in names])
+        result = self.extract(vars_and_pars, arrays='each', grid=grid)
         # pass the function aggregate_by_time to the dictionary 
-        # in order to get it in the namespace + create the datetimeindex
+        # in order to get it in the namespace.  The datetimeindex is created
+        # on first use.
         result['aggregate_by_time'] = aggregate_by_time
         global dt_index
-        dt_index = make_datetimeindex(result['Time'], 2010)
+        dt_index = None
         
         if process.mothers not in (None, []):
             result['mothers'] = process.mothers
         
-        if process.pp is not None:
-            for p in process.pp:
-                if self.verbose:
-                    print p
-                d = convert(p)
-                result.update(d)
+        # processes pickled before the engine was introduced have no engine
+        engine = getattr(process, 'engine', 'python')
+        for line, mothers in steps:
+            if self.verbose:
+                print line.string
+            if dt_index is None and 'dt_index' in line.names:
+                dt_index = make_datetimeindex(result['Time'], 2010)
+            d = convert(line, mothers)
+            result.update(d)
         
         result.pop('aggregate_by_time') 
+        if outputs is not None:
+            result = dict([(k, v) for k, v in result.iteritems() 
+                           if k in outputs or k == 'Time'])
         return result
         
-    def analyse_cputime(self, variables=None, interval=900, screendump=30):
+    def _sample_cputime(self, interval):
+        """
+        Return time, the indices of the samples every interval seconds and 
+        the cputime used in between the samples.
+        """
+        
+        time = self.get_value('Time')
+        try:
+            cputime = self.get_value('CPUtime')
+        except(ValueError):
+            raise ValueError("This simulation has no trajectory for CPUtime")
+        
+        x = np.arange(time[0], time[-1], interval)
+        index = np.searchsorted(time, x)
+        try:
+            cpu_smpl = cputime[index]
+        except(IndexError):
+            print "====================== ERROR ====================="
+            print "This IndexError can be caused by a wrong interval."
+            print "Your interval setting was %s seconds" % (interval)
+            print "Make sure the simulation has this output interval"
+            raise
+            
+        return time, index, np.diff(cpu_smpl)
+
+    def analyse_cputime(self, variables=None, interval=900, screendump=30,
+                        chunksize=1000, workers=1):
         """Analyse the relation between cputime and some variables.
     
         It is required that the time array of the simulation contains an 
@@ -634,6 +1064,10 @@ class Simulation:
         * interval: the desired interval for resampling, integer in seconds
         * screendump: integer, number of lines to print.  A negative number
           prints all the results
+        * chunksize: number of variables that are integrated and ranked 
+          together, as columns of a single matrix
+        * workers: if > 1 and variables = None, the chunks are divided over
+          a pool of this number of processes
         
     
         Output:
@@ -641,51 +1075,37 @@ class Simulation:
         dictionary with same keys as variables, and the correlation as values
         """
         
-        res = {}        
-        
-        #pdb.set_trace()
-        time = self.get_value('Time')
-        try:
-            cputime = self.get_value('CPUtime')
-        except(ValueError):
-            raise ValueError("This simulation has no trajectory for CPUtime")
-        
-        x = np.arange(time[0], time[-1], interval)
-        index = np.searchsorted(time, x)
-        try:
-            cpu_smpl = cputime[index]
-        except(IndexError):
-            print "====================== ERROR ====================="
-            print "This IndexError can be caused by a wrong interval."
-            print "Your interval setting was %s seconds" % (interval)
-            print "Make sure the simulation has this output interval"
-            raise
-            
-        cpu_diff = np.diff(cpu_smpl)
+        time, index, cpu_diff = self._sample_cputime(interval)
         
         if variables is None:
             self.separate()
-            variables = self.extract({v:v for v in self.variables})
+            names = list(self.variables)
+        else:
+            names = variables.keys()
+        chunks = [names[i:i+chunksize] for i in range(0, len(names), chunksize)]
         
-        for varname, array in variables.items():        
-            if varname.endswith('Int') or varname == 'CPUtime':
-                # we suppose the array is cumulative
-                var_cum = array
-            else:
-                var_cum = cumtrapz(array, time)
-                
+        if variables is None and use_pool(workers) and len(chunks) > 1:
+            pool = Pool(workers)
             try:
-                var_smpl = var_cum[index]
-            except(IndexError):
-                print "====================== ERROR ====================="
-                print "This IndexError can be caused by a wrong interval."
-                print "Your interval setting was %s seconds." % (interval)
-                print "Make sure the simulation has this output interval."
-                raise
-            
-            var_diff = np.diff(var_smpl)
-            
-            res[varname] = spearmanr(var_diff, cpu_diff)[0]
+                correlations = pool.map(_cputime_chunk, 
+                    [(self.filename, chunk, interval) for chunk in chunks])
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            correlations = []
+            for chunk in chunks:
+                if variables is None:
+                    values = self.get_values(chunk)
+                else:
+                    values = np.column_stack([variables[n] for n in chunk])
+                correlations.append(_cputime_correlations(time, index, 
+                    cpu_diff, chunk, values))
+        
+        if len(names) > 0:
+            res = dict(zip(names, np.concatenate(correlations)))
+        else:
+            res = {}
             
         good_results = {k:v for k,v in res.items() if not np.isnan(v)}
             
@@ -706,3 +1126,50 @@ class Simulation:
  
 
         return res
+
+    @staticmethod
+    def load_many(filenames, variables, arrays='sum', workers=1):
+        """
+        Load the same variables from many result files.
+        
+        This is a generator, yielding a tuple (filename, extracted) for each
+        file.  extracted is the dictionary returned by extract(variables, 
+        arrays) with in addition 'Time', or None if the file could not be
+        read.
+        
+        Parameters
+        ----------
+        - filenames: list with the result files
+        - variables: dictionary with short_name/long_name pairs (see 
+          extract()), or a list with long names that are used as short names
+        - arrays: the handling of array variables, see extract()
+        - workers: number of worker processes.  If workers > 1, the files are
+          loaded in a process pool and the results are yielded as soon as 
+          they are ready, so not in the order of filenames.  Only the
+          extracted numpy arrays are sent back by the workers.
+        
+        Example: 
+            for filename, values in Simulation.load_many(files, ['c1.T']):
+                print filename, values['c1.T'].max()
+        """
+        
+        if not isinstance(variables, dict):
+            variables = dict(zip(variables, variables))
+        var = dict(variables)
+        if 'Time' not in var.values():
+            var['Time'] = 'Time'
+        jobs = [(filename, var, arrays) for filename in filenames]
+        
+        if use_pool(workers) and len(jobs) > 1:
+            pool = Pool(workers)
+            try:
+                for result in pool.imap_unordered(_load_one, jobs):
+                    yield result
+            finally:
+                # also stops the workers if the caller does not iterate
+                # till the end
+                pool.terminate()
+                pool.join()
+        else:
+            for job in jobs:
+                yield _load_one(job)
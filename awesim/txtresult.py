@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming reader for Dymola result files in text format (.txt)
+
+The text format contains the same matrices as a .mat file, each preceded
+by a declaration line like 'float data_2(8761,1234)'.  The declared shapes
+are used to preallocate the arrays, and the numbers are parsed in large
+chunks by numpy directly from the file.  Memory use is therefore bounded
+by the size of the resulting arrays, independent of the number of lines.
+"""
+
+import re
+import numpy as np
+
+# declaration of a matrix, eg. 'float data_2(11,13)'
+DECLARATION = re.compile(r'^(char|int|float|double)\s+(\w+)\((\d+),(\d+)\)')
+# number of values parsed at once for data_1 and data_2
+CHUNK = 2**20
+
+
+def _read_numbers(f, shape, dtype, name, progress=None):
+    """
+    Read a numeric matrix with the given shape from the current position in f.
+
+    The values are parsed in chunks of about CHUNK values.  If progress is
+    given, it is called after each chunk as progress(name, rows_read, rows).
+    """
+
+    rows, cols = shape
+    data = np.empty(shape, dtype=dtype)
+    flat = data.reshape(-1)
+    rows_per_chunk = max(1, CHUNK // max(cols, 1))
+    row = 0
+    while row < rows:
+        n = min(rows_per_chunk, rows - row)
+        chunk = np.fromfile(f, dtype=dtype, count=n*cols, sep=' ')
+        if len(chunk) < n*cols:
+            raise IOError('%s in %s is shorter than declared' % (name, f.name))
+        flat[row*cols:(row+n)*cols] = chunk
+        row += n
+        if progress is not None:
+            progress(name, row, rows)
+    return data
+
+
+def read_txt(filename, progress=None):
+    """
+    Read a Dymola result file in text format.
+
+    Returns dataInfo, names, data_1, data_2 with the same orientation as
+    the (transposed) matrices of a .mat file.  The names are taken from the
+    comments in the dataInfo block.
+
+    progress (optional) is a function that is called as
+    progress(matrix_name, rows_read, rows) while data_1 and data_2 are read.
+    """
+
+    dataInfo, names, data_1, data_2 = None, None, None, None
+    f = open(filename, 'r')
+    try:
+        while data_2 is None:
+            line = f.readline()
+            if line == '':
+                break
+            declaration = DECLARATION.match(line)
+            if declaration is None:
+                continue
+            kind, name = declaration.group(1), declaration.group(2)
+            shape = (int(declaration.group(3)), int(declaration.group(4)))
+
+            if name == 'dataInfo':
+                # each line: 4 integers, followed by '# name'
+                lines = [f.readline() for i in range(shape[0])]
+                numbers = ' '.join([l.split('#')[0] for l in lines])
+                dataInfo = np.fromstring(numbers, dtype=int, sep=' ')
+                dataInfo = dataInfo.reshape(shape)
+                names = [l.split('# ')[-1].strip() for l in lines]
+            elif name in ('data_1', 'data_2'):
+                values = _read_numbers(f, shape, float, name, progress)
+                if name == 'data_1':
+                    data_1 = values
+                else:
+                    data_2 = values
+            elif kind == 'char':
+                # one line per string, not needed
+                for i in range(shape[0]):
+                    f.readline()
+    finally:
+        f.close()
+
+    if data_2 is None or data_1 is None or dataInfo is None:
+        raise IOError('%s is no Dymola result file' % (filename))
+
+    return dataInfo, names, data_1, data_2
+
+
+def _last_lines(f, begin, count, cols):
+    """
+    Return the last count lines of f after position begin, as lists of 
+    strings.  Each line has to contain cols numbers, else a ValueError is 
+    raised.
+    """
+
+    f.seek(0, 2)
+    end = f.tell()
+    block = 2**16
+    while True:
+        start = max(begin, end - block)
+        f.seek(start)
+        lines = f.read(end - start).split('\n')
+        if start > begin:
+            # the first line can be incomplete
+            lines = lines[1:]
+        lines = [l.split() for l in lines if l.strip() != '']
+        if len(lines) >= count or start == begin:
+            break
+        block *= 2
+    lines = lines[-count:]
+    if len(lines) < count or any([len(l) != cols for l in lines]):
+        raise ValueError('the rows of data_2 in %s are not on separate lines'
+                         % (f.name))
+    return lines
+
+
+def read_header(filename):
+    """
+    Read the declarations of a Dymola result file in text format, without 
+    parsing data_2.
+
+    Returns names, shape, time: the number of names, the shape of data_2
+    and an array with the time (first column of data_2) in the first and 
+    the second to last row, or an empty array if data_2 has less than 2 
+    rows.  Only the start and the end of data_2 are read, so each row of 
+    data_2 has to be on a single line, as Dymola writes it.  Otherwise, a 
+    ValueError is raised.
+    """
+
+    names, shape, time = None, None, None
+    data_1 = False
+    f = open(filename, 'r')
+    try:
+        while shape is None:
+            line = f.readline()
+            if line == '':
+                break
+            declaration = DECLARATION.match(line)
+            if declaration is None:
+                continue
+            kind, name = declaration.group(1), declaration.group(2)
+            size = (int(declaration.group(3)), int(declaration.group(4)))
+            if name == 'dataInfo':
+                names = size[0]
+                for i in range(size[0]):
+                    f.readline()
+            elif name == 'data_1':
+                _read_numbers(f, size, float, name)
+                data_1 = True
+            elif name == 'data_2':
+                shape = size
+            elif kind == 'char':
+                for i in range(size[0]):
+                    f.readline()
+        
+        if shape is None or names is None or not data_1:
+            raise IOError('%s is no Dymola result file' % (filename))
+        rows, cols = shape
+        if rows < 2:
+            time = np.array([])
+        else:
+            begin = f.tell()
+            first = np.fromfile(f, dtype=float, count=1, sep=' ')
+            lines = _last_lines(f, begin, 2, cols)
+            if len(first) < 1:
+                raise IOError('data_2 in %s is empty' % (filename))
+            time = np.array([first[0], float(lines[0][0])])
+    finally:
+        f.close()
+
+    return names, shape, time
@@ -10,6 +10,7 @@ import pandas as pd
 import numpy as np
 from scipy.integrate import cumtrapz
 from scipy.stats import spearmanr
+from scipy.interpolate import PchipInterpolator
 import pdb
 from copy import deepcopy
 import matplotlib.pyplot as plt
@@ -144,6 +145,130 @@ def aggregate_dataframe(dataframe, period=86400, interval=3600, label='middle'):
     return df_aggr
 
 
+def resample(time, values, grid, interpolation=0, extrapolation=0):
+    """
+    Return the values of a trajectory on a new time grid.
+    
+    values is a 1D array with the same length as time, or a 2D array with a
+    trajectory in each column.  time has to be non-decreasing and can 
+    contain duplicated event points: at an event, the value after the event
+    is taken.
+    
+    interpolation and extrapolation have the same meaning as the 3rd and 4th
+    column of dataInfo in a Dymola result file:
+        - interpolation = 0: linear, 1..4: spline.  A monotone piecewise 
+          cubic hermite spline (pchip) is used for the splines.
+        - extrapolation = -1: nan outside the time range, 0: keep the 
+          first/last value, 1: linear through the first/last two points
+          
+    The result keeps the dtype of values if it is a float.
+    """
+    
+    time = np.asarray(time)
+    values = np.asarray(values)
+    grid = np.asarray(grid, dtype=float)
+    n = len(time)
+    if n == 1:
+        result = np.repeat(values[:1], len(grid), axis=0).astype(float)
+    else:
+        i = np.clip(np.searchsorted(time, grid, side='right'), 1, n-1)
+        t0 = time[i-1]
+        dt = time[i] - t0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w = np.where(dt > 0, (grid - t0) / dt, 0.)
+        if values.ndim == 2:
+            w = w.reshape(-1, 1)
+        result = values[i-1] + w * (values[i] - values[i-1])
+    
+    before = grid < time[0]
+    after = grid > time[-1]
+    if extrapolation == -1:
+        result[before | after] = np.nan
+    elif extrapolation == 0 or n == 1:
+        result[before] = values[0]
+        result[after] = values[-1]
+    
+    inside = ~(before | after)
+    if interpolation > 0 and inside.any():
+        # spline through the points, with the values after the events
+        last = np.ones(n, dtype=bool)
+        last[:-1] = time[1:] != time[:-1]
+        if last.sum() > 2:
+            spline = PchipInterpolator(time[last], values[last], axis=0)
+            result[inside] = spline(grid[inside])
+    
+    if values.dtype.kind == 'f':
+        result = result.astype(values.dtype)
+    return result
+
+
+def use_pool(workers):
+    """
+    Return True if a process pool with the given number of workers is 
+    useful.
+    
+    Note that a pool cannot be used while a module is being imported: the 
+    threads of the pool need the import lock for pickling, which results in
+    a deadlock.  So do not run code with workers > 1 at import time.
+    """
+    
+    return workers > 1
+
+
+def rank_columns(a):
+    """
+    Return the ranks of the values in each column of the 2D array a.
+    
+    The ranks start at 1 and tied values get the average of their ranks, 
+    like scipy.stats.rankdata() on each column.  All columns are ranked at
+    once.
+    """
+    
+    n, k = a.shape
+    cols = np.arange(k)
+    order = np.argsort(a, axis=0, kind='mergesort')
+    sorted_a = a[order, cols]
+    position = np.arange(n).reshape(n, 1).repeat(k, axis=1)
+    # first and last position of each group of equal values
+    first = np.ones((n, k), dtype=bool)
+    first[1:] = sorted_a[1:] != sorted_a[:-1]
+    last = np.ones((n, k), dtype=bool)
+    last[:-1] = first[1:]
+    start = np.maximum.accumulate(np.where(first, position, 0), axis=0)
+    end = np.minimum.accumulate(np.where(last, position, n-1)[::-1], axis=0)[::-1]
+    ranks = np.empty((n, k))
+    ranks[order, cols] = (start + end) / 2. + 1
+    return ranks
+
+
+def spearman_columns(a, b):
+    """
+    Return an array with the Spearman rank correlation of each column of a
+    with the 1D array b.
+    
+    This gives the same result as spearmanr(a[:,i], b)[0] for each column i,
+    but in a single vectorized pass.  The correlation is nan for constant 
+    columns and columns containing nan.
+    """
+    
+    a = np.asarray(a)
+    b = np.asarray(b)
+    if a.ndim == 1:
+        a = a.reshape(-1, 1)
+    ranks_a = rank_columns(a)
+    ranks_b = rank_columns(b.reshape(-1, 1))
+    ranks_a -= ranks_a.mean(axis=0)
+    ranks_b -= ranks_b.mean(axis=0)
+    # no np.dot: BLAS threads can deadlock in forked pool workers
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = (ranks_a * ranks_b).sum(axis=0) / np.sqrt(
+            (ranks_a**2).sum(axis=0) * (ranks_b**2).sum())
+    corr[np.isnan(a).any(axis=0)] = np.nan
+    if np.isnan(b).any():
+        corr[:] = np.nan
+    return corr
+
+
 def analyse_cputime_single(cputime, time, var, cumulative=False, interval=900, plot=True):
     """Analyse the relation between cputime and a trajectory.
     
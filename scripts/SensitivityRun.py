@@ -14,7 +14,7 @@ import pp
 from shutil import rmtree
 
 import pymosim
-from simman import Simulation, Simdex
+from awesim import Simulation, Simdex
 
 sys.path.append(os.path.abspath(r'D:\Ruben_BWK239\GIT_python'))
 
@@ -121,17 +121,25 @@ if get_results:
     for par in pars:
         parameters[par[2]] = par[0]
     
-    for r in results:
-        print ''.join(['\t - ', r['mat_file']])
+    # everything needed for the analysis is extracted in a single pass over
+    # the .mat files, in ncpus processes
+    to_extract = dict(parameters)
+    to_extract.update(variables)
+    to_extract['n_C'] = u'building_forGrid.heaSys.n_C'
+    to_extract['TopAsked'] = u'building_forGrid.TopAsked[x]'
+    to_extract['Top'] = u'building_forGrid.Top[x]'
+    results_by_file = dict([(r['mat_file'], r) for r in results])
+    for mat_file, extracted in Simulation.load_many(results_by_file.keys(), 
+                                                    to_extract, arrays='each',
+                                                    workers=ncpus):
+        print ''.join(['\t - ', mat_file])
+        if extracted is None:
+            raise IOError('%s could not be read' % (mat_file))
         # r is the dictionary containing all results for this specific run
-        sim = Simulation(r['mat_file'])
-         # we add info to the dictionary: key = var, values = value for var        
-        for k,v in parameters.iteritems():
-            r[k] = sim.get_value(v)
-        for k,v in variables.iteritems():
-            r[k] = sim.get_value(v)
-        # we also get Time 
-        r['Time'] = sim.get_value('Time')
+        # we add info to the dictionary: key = var, values = value for var
+        # (Time is always included)
+        r = results_by_file[mat_file]
+        r.update(extracted)
 
 ###############################################################################        
 if analyse_results:  
@@ -149,14 +157,13 @@ if analyse_results:
         r['TDHW_min'] = min(r['TMixed'])
         
         # Heating analysis
-        # this could be more efficient: getting the results should happen in the 
-        # previous section in order to avoid recreating sim objects
+        # the zone temperatures were extracted as a column per zone
         total = 0
-        sim = Simulation(r['mat_file'])
-        for z in range(int(sim.get_value(u'building_forGrid.heaSys.n_C'))):
+        top_asked = r['TopAsked'].reshape((len(r['Time']), -1))
+        top = r['Top'].reshape((len(r['Time']), -1))
+        for z in range(int(r['n_C'])):
             var_name = ''.join(['discomfort_zone_', str(z+1)])
-            dt = sim.get_value(''.join([u'building_forGrid.TopAsked[', str(z+1), u']'])) \
-                 - sim.get_value(''.join([u'building_forGrid.Top[', str(z+1), u']']))
+            dt = top_asked[:, z] - top[:, z]
             dt[np.nonzero(dt<0)]=0
             dt_int = np.trapz(dt, r['Time'])/3600 # in Kh
             r[var_name] = dt_int.sum()
@@ -14,8 +14,10 @@ import unittest
 from os import getcwd, path, remove
 from cStringIO import StringIO
 import sys
+import re
+import cPickle as pickle
 import matplotlib
-from awesim import Simulation, Simdex, Result, Process, load_simdex
+from awesim import Simulation, Simdex, Result, Process, load_simdex, probe
 from awesim.utilities import *
 import pandas as pd
 
@@ -99,6 +101,38 @@ class ProcessTest(unittest.TestCase):
         self.assertEqual(process.variables, {'Time':'Time',
                                              'c_1_T':'c[1].T', 'c_2_T':'c[2].T', 'c1_T':'c1.T'})
 
+    def test_get_plan(self):
+        """The pp strings should be compiled once, with their dependencies"""
+
+        p = Process(mothers=self.mothers, parameters=self.parameters,
+                    sub_pars=self.sub_pars, sub_vars=self.sub_vars,
+                    pp=['Qflow10 = 10 * Qflow', 'Q20 = 2 * Qflow10',
+                        'R2 = res * 2'])
+        plan = p.get_plan()
+        self.assertTrue(plan is p.get_plan())
+        self.assertEqual([l.on_mothers for l in plan], [True, True, False])
+        self.assertEqual(plan[1].mothers[1][0], 'c2_Q20')
+        self.assertTrue('c1_Qflow10' in plan[1].dependencies)
+        self.assertEqual(plan[2].dependencies, set(['res']))
+        self.assertTrue(p.sub_vars.has_key('Qflow10'))
+        p2 = pickle.loads(pickle.dumps(p))
+        # the plan is pickled with the process, not made again
+        self.assertTrue(p2.__dict__.has_key('_plan'))
+        self.assertEqual(len(p2.get_plan()), 3)
+
+    def test_get_plan_numexpr(self):
+        """Only element-wise pp strings can be evaluated by numexpr"""
+
+        p = Process(mothers=self.mothers, sub_vars=self.sub_vars,
+                    pp=['a = 10 * Qflow + np.sqrt( Qflow )',
+                        'b = np.where( Qflow > 0, Qflow , 0)',
+                        'c = np.amax( Qflow )', 'd = Qflow [ 0 ]'],
+                    integrate={'Qflow': 1}, engine='numexpr')
+        plan = p.get_plan()
+        self.assertEqual([l.numexpr_names is not None for l in plan],
+                         [False, True, True, False, False])
+        self.assertEqual(plan[1].numexpr_names, set(['Qflow']))
+
 class ResultTest(unittest.TestCase):
     """Class for testing Result"""
     
@@ -272,6 +306,39 @@ class SimulationTest(unittest.TestCase):
                             'Simulation.__init__() dit not create \
                             attribute %s' % attr)
                             
+    def test___init__variables(self):
+        """Only the selected variables (and Time) should be loaded"""
+        
+        sim_all = Simulation('Array')
+        sim = Simulation('Array', variables=['c[x].T', 'r[2].heatPort_a.Q_flow'])
+        self.assertEqual(sim_all.names, sim.names)
+        self.assertEqual(sim_all.parameters, sim.parameters)
+        for name in ['Time', 'c[1].T', 'c[4].T', 'r[2].heatPort_a.Q_flow', 
+                     'c[1].C']:
+            np.testing.assert_equal(sim_all.get_value(name), 
+                                    sim.get_value(name))
+        self.assertRaises(ValueError, sim.get_value, 'c[2].der(T)')
+        extracted = sim.extract({'T':'c[x].T', 'dT':'c[x].der(T)'}, 
+                                arrays='each')
+        np.testing.assert_equal(extracted['T'], 
+            sim_all.extract({'T':'c[x].T'}, arrays='each')['T'])
+        self.assertFalse(extracted.has_key('dT'))
+                            
+    def test___init__txt(self):
+        """
+        Tests creation of Simulation object from a result file in text format
+        Make sure the file ResultFileTxtFormat.txt is in the current work directory
+
+        """
+        sim = Simulation('ResultFileTxtFormat.txt')
+        self.assertEqual(46, len(sim.names))
+        self.assertEqual((46, 4), sim.dataInfo.shape)
+        self.assertEqual((2, 7), sim.data_1.shape)
+        self.assertEqual((11, 13), sim.data_2.shape)
+        self.assertEqual(1.32947e6, sim.get_value('building.RC.cZon'))
+        np.testing.assert_equal(sim.get_value('building.RC.heatPortCon.Q_flow'),
+                                -sim.get_value('building.hvac.heatPortCon.Q_flow'))
+                            
     def test___init__wrongmatfile(self):
         """
         Test if an IOError is raised when a wrong type of .mat file is used
@@ -283,6 +350,37 @@ class SimulationTest(unittest.TestCase):
         self.assertRaises(IOError, Simulation, 'EmptyMatFile.mat')
             
     
+    def test_probe(self):
+        """probe() should give the time range without loading the file"""
+        
+        info = probe('LinkedCapacities')
+        time = Simulation('LinkedCapacities').get_value('Time')
+        self.assertEqual(info['start'], time[0])
+        self.assertEqual(info['stop'], time[-1])
+        self.assertEqual(info['rows'], 52)
+        self.assertEqual(info['names'], 16)
+        info = probe('SubfolderWithCrappyFiles/LinkedCapacities_D_TooShort.mat')
+        self.assertTrue(info['stop'] < time[-1])
+        info = probe('ResultFileTxtFormat.txt')
+        self.assertEqual((info['start'], info['stop']), (0, 544320))
+        self.assertEqual((info['names'], info['rows'], info['columns']), 
+                         (46, 11, 13))
+        
+        # rows of data_2 over several lines: the whole file is parsed
+        import tempfile, shutil
+        folder = tempfile.mkdtemp()
+        try:
+            wrapped = path.join(folder, 'wrapped.txt')
+            lines = open('ResultFileTxtFormat.txt').readlines()
+            row = lines[-1].split()
+            lines[-1] = ' '.join(row[:5]) + '\n' + ' '.join(row[5:]) + '\n'
+            open(wrapped, 'w').writelines(lines)
+            self.assertEqual(probe(wrapped)['names'], 46)
+            self.assertEqual(probe(wrapped)['stop'], 544320)
+        finally:
+            shutil.rmtree(folder)
+        self.assertRaises(IOError, probe, 'SubfolderWithCrappyFiles/EmptyMatFile.mat')
+        
     def test_exist(self):
         """
         Test if :
@@ -362,6 +460,51 @@ class SimulationTest(unittest.TestCase):
                         'Time should contain exactly 51 values, \
                         from 0 to 10000 (incl.) in steps of 200')
         
+    def test_get_values(self):
+        """get_values() should return the same values as get_value()"""
+        
+        sim = Simulation('Array')
+        names = ['c[1].T', 'c[2].heatPort.Q_flow', 'r[4].heatPort_b.Q_flow']
+        values = sim.get_values(names)
+        self.assertEqual(values.shape, (51, 3))
+        for i, name in enumerate(names):
+            np.testing.assert_equal(values[:, i], sim.get_value(name))
+        pars = sim.get_values(['c[1].C', 'c[2].C'])
+        np.testing.assert_equal(pars, np.array([[600., 1000.]]))
+        self.assertRaises(ValueError, sim.get_values, ['c[1].T', 'c[1].C'])
+        self.assertRaises(ValueError, sim.get_values, ['c[1].T', 'wrongname'])
+        
+    def test_get_aliases(self):
+        """Alias groups cover all variables, with signs relative to the first"""
+        
+        sim = Simulation('LinkedCapacities')
+        groups = sim.get_aliases()
+        self.assertEqual(sorted([n for g in groups for n, sign in g]),
+                         sorted(sim.variables))
+        self.assertTrue([('c1.heatPort.Q_flow', 1), ('c2.heatPort.Q_flow', -1),
+                         ('r.heatPort_a.Q_flow', -1), 
+                         ('r.heatPort_b.Q_flow', 1)] in groups)
+        for group in groups:
+            first = sim.get_value(group[0][0])
+            for name, sign in group:
+                np.testing.assert_equal(sim.get_value(name), sign * first)
+        
+    def test_get_constants(self):
+        """Constant trajectories are found in blocks of rows"""
+        
+        import awesim.simulation
+        rows = awesim.simulation._CONSTANT_ROWS
+        awesim.simulation._CONSTANT_ROWS = 3
+        try:
+            sim = Simulation('./TestSet2/reswithCPUtime')
+            constants = sim.get_constants()
+        finally:
+            awesim.simulation._CONSTANT_ROWS = rows
+        expected = [name for name in sim.variables if 
+                    np.all(sim.get_value(name) == sim.get_value(name)[0])]
+        self.assertTrue('TOpSet[1].y' in constants)
+        self.assertEqual(sorted(constants), sorted(expected))
+        
     def test_separate_attributes_present(self):
         """ Tests if the right attributes are created """
         
@@ -427,6 +570,55 @@ class SimulationTest(unittest.TestCase):
         for k,v in extracted.items():
             np.testing.assert_equal(v, sim.get_value(k))
 
+    def test_extract_arrays(self):
+        """check extract() with [x] for sum, mean and each"""
+
+        sim = Simulation('Array')
+        names = ['c[%d].der(T)' % i for i in range(1, 5)]
+        values = sim.get_values(names)
+        var = {'dT': 'c[x].der(T)', 'C': 'c[x].C', 'Q': 'c[x].heatPort.Q_flow'}
+        each = sim.extract(var, arrays='each')
+        np.testing.assert_equal(each['dT'], values)
+        self.assertEqual(each['C'].shape, (1, 4))
+        self.assertEqual(each['Q'].shape, values.shape)
+        np.testing.assert_allclose(sim.extract(var)['dT'], values.sum(axis=1),
+                                   rtol=1e-6)
+        np.testing.assert_allclose(sim.extract(var, arrays='mean')['dT'],
+                                   values.mean(axis=1), rtol=1e-6)
+        self.assertEqual(sim.extract({'r': 'r[x].heatPort_a.Q_flow',
+                                      'n': 'nothing[x]'}).keys(), ['r'])
+
+    def test_extract_arrays_case(self):
+        """Array families are found like the regex: any case, at the end"""
+
+        from awesim.simulation import _array_regex
+        sim = Simulation('Array')
+        np.testing.assert_equal(
+            sim.extract({'T': 'C[x].t'}, arrays='each')['T'],
+            sim.extract({'T': 'c[x].T'}, arrays='each')['T'])
+        for long_name in ['C[x].t', 'c[x].HEATPORT.T', 'values[x]', 
+                          'r[x].heatPort_a.T', 'STARTS[x]', 'c[3].T[x]']:
+            self.assertEqual(sim._array_names(long_name), 
+                             sim.exist(_array_regex(long_name)))
+        self.assertEqual(sim._array_names('values[x]'), 
+                         ['cvalues[%d]' % i for i in range(1, 5)])
+
+    def test_load_many(self):
+        """load_many extracts the same variables from each file"""
+        
+        filenames = ['LinkedCapacities.mat', 'Array.mat', 'NoFile.mat']
+        loaded = dict(Simulation.load_many(filenames, 
+                                           {'T':'c1.T', 'T2':'c[x].T'},
+                                           arrays='each', workers=2))
+        self.assertEqual(sorted(loaded.keys()), sorted(filenames))
+        self.assertEqual(loaded['NoFile.mat'], None)
+        sim = Simulation('LinkedCapacities.mat')
+        self.assertEqual(sorted(loaded['LinkedCapacities.mat'].keys()), 
+                         ['T', 'Time'])
+        np.testing.assert_equal(loaded['LinkedCapacities.mat']['T'], 
+                                sim.get_value('c1.T'))
+        self.assertEqual(loaded['Array.mat']['T2'].shape, (51, 4))
+        
     def test_get_objects(self):
         """Test if get_objects works with empty mother model"""
         
@@ -443,6 +635,178 @@ class SimulationTest(unittest.TestCase):
         obj_sorted = sorted(obj)
         self.assertEqual(obj_sorted, sorted(['heatPort', 'C', u'T', u'der(T)']))                
 
+    def test_get_objects_array(self):
+        """get_objects and the name tree should handle array indices"""
+        
+        sim = Simulation('Array')
+        tree = sim._get_tree()
+        mothers = [o for o in sim.get_objects() if o.startswith('c[')]
+        self.assertEqual(4, len(mothers))
+        self.assertTrue('heatPort' in sim.get_objects(re.escape(mothers[0])))
+        self.assertEqual(sorted(sim.get_objects(re.escape(mothers[0]))), 
+                         tree.children(mothers[0]))
+        self.assertEqual(sim.get_objects(mothers[0]), 
+                         sim.children(mothers[0]))
+        self.assertEqual(sim.find('c[[]*[]].heatPort.Q_flow'), 
+                         tree.find('c[[]*[]].heatPort.Q_flow'))
+        self.assertEqual(sorted(sim.exist('heatport.q_flow')), 
+                         tree.find('c[[]*[]].heatPort.Q_flow'))
+        self.assertEqual(sorted(tree.find('**.heatPort.Q_flow')), 
+                         sorted(tree.find('*.heatPort.Q_flow')))
+        self.assertEqual(len(tree.below(mothers[0])), 
+                         len(sim.exist(re.escape(mothers[0]) + '\\.')))
+
+    def test_separate_baseline(self):
+        """Names and separate() are the same as with a loop over the rows"""
+        
+        import glob
+        import scipy.io
+        for filename in glob.glob('*.mat'):
+            sim = Simulation(filename)
+            matrices = scipy.io.loadmat(filename, chars_as_strings=False)
+            name, dataInfo = matrices['name'], matrices['dataInfo']
+            data_1 = matrices['data_1']
+            if ''.join(matrices['Aclass'][3]).startswith('binTrans'):
+                name, dataInfo, data_1 = name.T, dataInfo.T, data_1.T
+            names = [''.join(row).strip(' \x00') for row in name]
+            self.assertEqual(sim.names, names)
+            
+            parameters, variables = [], []
+            for i, n in enumerate(names):
+                if dataInfo[i, 0] == 1:
+                    pos = abs(dataInfo[i, 1])
+                    sign = np.sign(dataInfo[i, 1])
+                    parameters.append((n, data_1[0, pos-1] * sign))
+                else:
+                    variables.append(n)
+            parameters.sort()
+            self.assertEqual(sim.parameters, [p for p, v in parameters])
+            np.testing.assert_array_equal(sim.parametervalues, 
+                                          [v for p, v in parameters])
+            self.assertEqual(sim.variables, sorted(variables))
+
+    def test_separate_cache(self):
+        """separate() is done again when its data is replaced"""
+        
+        sim = Simulation('LinkedCapacities')
+        parameters = sim.parameters
+        values = sim.parametervalues.copy()
+        sim.separate()
+        self.assertTrue(sim.parameters is parameters)
+        
+        sim.data_1 = sim.data_1 * 2
+        sim.separate()
+        np.testing.assert_array_equal(sim.parametervalues, 2 * values)
+        
+        # a variable becomes a parameter
+        dataInfo = sim.dataInfo.copy()
+        dataInfo[sim.names.index('c1.T'), :2] = [1, 1]
+        sim.dataInfo = dataInfo
+        sim.separate()
+        self.assertTrue('c1.T' in sim.parameters)
+        self.assertFalse('c1.T' in sim.variables)
+        self.assertEqual(len(sim.parameters), len(parameters) + 1)
+
+    def test_mat4(self):
+        """The MAT v4 reader gives the same matrices as scipy.io.loadmat"""
+        
+        import glob
+        import scipy.io
+        from awesim import mat4
+        filenames = glob.glob('*.mat') + \
+            glob.glob('SubfolderWithCrappyFiles/LinkedCapacities*.mat')
+        for filename in filenames:
+            expected = scipy.io.loadmat(filename, chars_as_strings=False)
+            f = open(filename, 'rb')
+            try:
+                headers = mat4.read_headers(f)
+                self.assertEqual(sorted(headers), 
+                    sorted([k for k in expected if not k.startswith('__')]))
+                for name, header in headers.items():
+                    matrix = mat4.read_matrix(f, header)
+                    if header.text:
+                        matrix = matrix.astype('U1')
+                    np.testing.assert_array_equal(matrix, expected[name])
+            finally:
+                f.close()
+            np.testing.assert_array_equal(
+                mat4.memmap_matrix(filename, headers['data_2']), 
+                expected['data_2'])
+        
+        # a matrix that does not fit in the file
+        import tempfile, shutil
+        folder = tempfile.mkdtemp()
+        try:
+            filename = path.join(folder, 'truncated.mat')
+            open(filename, 'wb').write(
+                open('LinkedCapacities.mat', 'rb').read()[:-10])
+            self.assertRaises(IOError, mat4.read_headers, 
+                              open(filename, 'rb'))
+        finally:
+            shutil.rmtree(folder)
+
+    def test_mat4_binnormal(self):
+        """Files with transposed (binTrans) and normal matrices are equal"""
+        
+        import tempfile, shutil
+        import scipy.io
+        matrices = scipy.io.loadmat('LinkedCapacities.mat', 
+                                    chars_as_strings=False)
+        matrices['Aclass'][3, :] = list('binNormal  ')
+        normal = {}
+        for name in ['Aclass', 'name', 'description']:
+            # text matrices are saved as an array of strings
+            rows = matrices[name] if name == 'Aclass' else matrices[name].T
+            normal[name] = np.array([''.join([c or '\x00' for c in row]) 
+                                     for row in rows])
+        for name in ['dataInfo', 'data_1', 'data_2']:
+            normal[name] = matrices[name].transpose()
+        folder = tempfile.mkdtemp()
+        try:
+            filename = path.join(folder, 'normal.mat')
+            scipy.io.savemat(filename, normal, format='4')
+            sim = Simulation(filename)
+            trans = Simulation('LinkedCapacities')
+            self.assertEqual(sim.names, trans.names)
+            np.testing.assert_array_equal(sim.dataInfo, trans.dataInfo)
+            np.testing.assert_array_equal(sim.data_1, trans.data_1)
+            np.testing.assert_array_equal(sim.data_2, trans.data_2)
+            for name in trans.names:
+                np.testing.assert_array_equal(sim.get_value(name), 
+                                              trans.get_value(name))
+        finally:
+            shutil.rmtree(folder)
+
+    def test_get_objects_regex(self):
+        """A plain mother is a tree path, otherwise a regular expression"""
+        
+        sim = Simulation('LinkedCapacities') 
+        self.assertEqual(sim.get_objects('c1'), sim.children('c1'))
+        self.assertEqual(sim.get_objects('C1'), sim.get_objects('c1'))
+        self.assertEqual(sim.get_objects('c1.T'), [])
+        self.assertEqual(sorted(sim.get_objects('c[12]')), 
+                         sorted(set(sim.get_objects('c1') + 
+                                    sim.get_objects('c2'))))
+
+    def test_name_tree(self):
+        """Nested brackets do not split a name, searches are bounded"""
+        
+        from awesim import nametree
+        self.assertEqual(nametree.split_name('der(a.b[1].c).x'), 
+                         ['der(a.b[1].c)', 'x'])
+        self.assertEqual(nametree.split_name('a.b[f(c.d)].e'), 
+                         ['a', 'b[f(c.d)]', 'e'])
+        tree = nametree.NameTree(['a.b', 'der(a.b[1].c)', 'A.c'])
+        self.assertEqual(tree.children('der(a.b[1].c)'), [])
+        self.assertEqual(tree.search('a.B'), ['a.b', 'der(a.b[1].c)'])
+        self.assertEqual(tree.search('a\\.c'), ['A.c'])
+        self.assertEqual(tree.search('a.b[1]'), [])
+        self.assertEqual(tree.search('B'), ['a.b', 'der(a.b[1].c)'])
+        self.assertEqual(tree.search('A.'), ['a.b', 'der(a.b[1].c)', 'A.c'])
+        for i in range(2 * nametree.SEARCHES):
+            tree.search('c' * i)
+        self.assertEqual(len(tree._searches), nametree.SEARCHES)
+
     def test_postprocess_nopp(self):
         """Try a basic extraction via a post processing on a simulation"""
         
@@ -524,6 +888,48 @@ class SimulationTest(unittest.TestCase):
         self.assertIsNotNone(result_pp['Time_Int'])     
 
 
+    def test_postprocess_numexpr(self):
+        """Postprocessing with numexpr should give the same results"""
+        
+        import awesim.process
+        sim = Simulation('LinkedCapacities')
+        pp = ['T_degC = T - 273.15', 'T_high = T_degC > 390',
+              'Q_abs = np.sqrt( Q * Q ) + cap', 'T2 = np.amax( T )']
+        results = []
+        min_size = awesim.process.NUMEXPR_MIN_SIZE
+        awesim.process.NUMEXPR_MIN_SIZE = 1
+        try:
+            for engine in ['python', 'numexpr']:
+                process = Process(mothers=['c1', 'c2'], 
+                                  sub_vars={'T':'T', 'Q':'heatPort.Q_flow'},
+                                  sub_pars={'cap':'C'}, pp=pp, engine=engine)
+                results.append(sim.postprocess(process))
+        finally:
+            awesim.process.NUMEXPR_MIN_SIZE = min_size
+        for name in ['c1_T_degC', 'c2_T_high', 'c1_Q_abs', 'c2_T2']:
+            np.testing.assert_allclose(results[0][name], results[1][name],
+                                       rtol=1e-6)
+
+    def test_postprocess_outputs(self):
+        """Only what is needed for the outputs should be extracted"""
+        
+        sim = Simulation('LinkedCapacities')
+        process = Process(mothers=['c1', 'c2'], 
+                          sub_vars={'T':'T', 'Q':'heatPort.Q_flow'},
+                          sub_pars={'cap':'C'}, 
+                          pp=['T_degC = T - 273.15', 'T_max = np.amax( T_degC )',
+                              'E = cap * T', 'Tr = Time / 3600'],
+                          integrate={'Q':1})
+        names, steps = process.get_requirements(['c2_T_max'])
+        self.assertEqual(names, set(['c2_T']))
+        self.assertEqual([line.target for line, mothers in steps], 
+                         ['T_degC', 'T_max'])
+        result_pp = sim.postprocess(process, outputs=['c2_T_max', 'c1_E'])
+        self.assertEqual(sorted(result_pp.keys()), ['Time', 'c1_E', 'c2_T_max'])
+        result_all = sim.postprocess(process)
+        self.assertEqual(result_pp['c2_T_max'], result_all['c2_T_max'])
+        np.testing.assert_equal(result_pp['c1_E'], result_all['c1_E'])
+
     def test_postprocess_aggregation(self):
         """Postprocessing with aggregation on standard variables and mothers"""
         
@@ -564,6 +970,12 @@ class SimulationTest(unittest.TestCase):
         extracted = sim.extract({v:v for v in sim.variables})
         corr = sim.analyse_cputime(interval=1000)
         self.assertListEqual(sorted(extracted.keys()), sorted(corr.keys()))
+        corr_chunks = sim.analyse_cputime(interval=1000, screendump=0, 
+                                          chunksize=10, workers=2)
+        corr_dict = sim.analyse_cputime(extracted, interval=1000, screendump=0)
+        for k in corr:
+            np.testing.assert_allclose(corr_chunks[k], corr[k], rtol=1e-12)
+            np.testing.assert_allclose(corr_dict[k], corr[k], rtol=1e-12)
         
 class SimdexTest(unittest.TestCase):
     """
@@ -774,6 +1186,451 @@ class SimdexTest(unittest.TestCase):
         self.simdex.scan(folder = folder, process=process)
         self.assertEqual(len(self.simdex.simulations), 16)
 
+    def test_scan_workers(self):
+        """The SIDs follow the sorted filenames, also with workers"""
+        
+        simdex = Simdex(h5='simdex_workers.h5')
+        simdex.scan(workers=2)
+        self.assertEqual(simdex.simulations, self.simdex.simulations)
+        self.assertEqual(simdex.files, self.simdex.files)
+        self.assertEqual([simdex.files[sid] for sid in simdex.simulations],
+                         self.sims)
+        np.testing.assert_array_equal(simdex.variablemap, 
+                                      self.simdex.variablemap)
+        remove(simdex.h5_path)
+
+    def test_merge_pending(self):
+        """The maps are the same when simulations are added one by one"""
+        
+        simdex = Simdex(h5='simdex_one_by_one.h5')
+        for filename in self.sims:
+            simdex.index_one_sim(Simulation(filename))
+            self.assertEqual(simdex.variablemap.shape, 
+                             (len(simdex.variables), len(simdex.simulations)))
+        self.assertEqual(simdex.parameters, self.simdex.parameters)
+        self.assertEqual(simdex.variables, self.simdex.variables)
+        np.testing.assert_array_equal(simdex.parametermap, 
+                                      self.simdex.parametermap)
+        np.testing.assert_array_equal(simdex.parametervalues, 
+                                      self.simdex.parametervalues)
+        np.testing.assert_array_equal(simdex.variablemap, 
+                                      self.simdex.variablemap)
+        remove(simdex.h5_path)
+
+    def test_add_summary_error(self):
+        """A simulation that fails while it is added leaves no trace"""
+        
+        from awesim.simdex import _summarize
+        sids = list(self.simdex.simulations)
+        summary = _summarize(Simulation('LinkedCapacities.mat'))
+        # the alias Time exists already: writing the h5 fails
+        summary['arrays'].append(('extra', np.ones(3), None, [('Time', 1)]))
+        self.assertRaises(Exception, self.simdex._add_summary, summary)
+        self.assertEqual(self.simdex.simulations, sids)
+        self.simdex.merge_pending()
+        self.assertEqual(self.simdex.parametermap.shape[1], len(sids))
+        
+        self.simdex.index_one_sim(Simulation('LinkedCapacities.mat'))
+        self.assertEqual(len(self.simdex.simulations), len(sids) + 1)
+        self.assertEqual(self.simdex.variablemap.shape[1], len(sids) + 1)
+        self.assertEqual(len(self.simdex.get('c1.T').val), len(sids))
+
+    def test_structures(self):
+        """Simulations of the same model share their structures"""
+        
+        nsims = len(self.simdex.simulations)
+        self.assertEqual(len(self.simdex._parids), nsims)
+        self.assertTrue(self.simdex._parstructures.shape[1] < nsims)
+        self.assertTrue(self.simdex._varstructures.shape[1] < nsims)
+        for i in range(nsims):
+            np.testing.assert_array_equal(
+                self.simdex.parametermap[:, i], 
+                self.simdex._parstructures[:, self.simdex._parids[i]])
+        
+        # the structures survive filtering and saving
+        sid = self.simdex.simulations[0]
+        similar = self.simdex.filter_similar(sid)
+        self.assertEqual(similar._parstructures.shape[1], 1)
+        similar.save('Test_structures.dat')
+        loaded = load_simdex('Test_structures.dat')
+        np.testing.assert_array_equal(loaded.parametermap, 
+                                      similar.parametermap)
+        np.testing.assert_array_equal(loaded.variablemap, 
+                                      similar.variablemap)
+        remove('Test_structures.dat')
+
+    def test_scan_workers_plan(self):
+        """The targets of pp lines on the mothers are known after a scan"""
+        
+        process = Process(mothers=['c1', 'c2'], sub_vars={'T':'T'}, 
+                          pp=['T_degC = T - 273.15'])
+        self.simdex = Simdex()
+        self.simdex.scan(process=process, workers=2)
+        self.assertTrue(self.simdex.process.sub_vars.has_key('T_degC'))
+        result = self.simdex.get('T_degC')
+        sid = self.simdex.simulations[1]
+        sim = Simulation(self.simdex.files[sid])
+        np.testing.assert_array_almost_equal(
+            result.val[sid], np.column_stack((sim.get_value('c1.T'), 
+                                              sim.get_value('c2.T'))) - 273.15)
+
+    def test_scan_again(self):
+        """A rescan only indexes new and changed files"""
+        
+        sids = list(self.simdex.simulations)
+        self.simdex.scan()
+        self.assertEqual(self.simdex.simulations, sids)
+        
+        # a changed file gets a new SID, the others are kept
+        changed = self.simdex.files[sids[1]]
+        size, mtime, md5 = self.simdex.signatures[sids[1]]
+        self.simdex.signatures[sids[1]] = (size, mtime - 1, md5)
+        self.simdex.scan()
+        self.assertEqual(self.simdex.simulations, sids[:1] + sids[2:] + 
+                         ['SID%04d' % len(sids)])
+        self.assertEqual(self.simdex.files['SID%04d' % len(sids)], changed)
+        self.assertEqual(sorted(self.simdex.get_filenames(form='path')), 
+                         self.sims)
+        
+        # with checksum, a touched file is not indexed again
+        self.simdex = Simdex()
+        self.simdex.scan(checksum=True)
+        sids = list(self.simdex.simulations)
+        size, mtime, md5 = self.simdex.signatures[sids[1]]
+        self.simdex.signatures[sids[1]] = (size, mtime - 1, md5)
+        self.simdex.scan(checksum=True)
+        self.assertEqual(self.simdex.simulations, sids)
+        self.assertEqual(self.simdex.signatures[sids[1]], (size, mtime, md5))
+
+    def test_scan_again_invalid(self):
+        """A changed file that cannot be indexed keeps its old SID"""
+        
+        import tempfile, shutil
+        folder = tempfile.mkdtemp()
+        try:
+            shutil.copy('LinkedCapacities.mat', folder)
+            self.simdex = Simdex()
+            self.simdex.scan(folder=folder)
+            sids = list(self.simdex.simulations)
+            values = self.simdex.get('c1.T').val
+            f = open(path.join(folder, 'LinkedCapacities.mat'), 'wb')
+            f.write('no Dymola result file')
+            f.close()
+            self.simdex.scan(folder=folder)
+            self.assertEqual(self.simdex.simulations, sids)
+            np.testing.assert_array_equal(self.simdex.get('c1.T').val[sids[0]],
+                                          values[sids[0]])
+        finally:
+            shutil.rmtree(folder)
+
+    def test_scan_first_invalid(self):
+        """The time range is only taken from a first file that loads"""
+        
+        import tempfile, shutil
+        import scipy.io
+        folder = tempfile.mkdtemp()
+        try:
+            # a.mat has valid headers and time, but no dataInfo
+            matrices = scipy.io.loadmat(
+                'SubfolderWithCrappyFiles/LinkedCapacities_D_TooShort.mat',
+                chars_as_strings=False)
+            broken = {}
+            for name in ['Aclass', 'name', 'description']:
+                broken[name] = np.array([''.join([c or '\x00' for c in row]) 
+                                         for row in matrices[name]])
+            for name in ['data_1', 'data_2']:
+                broken[name] = matrices[name]
+            scipy.io.savemat(path.join(folder, 'a.mat'), broken, format='4')
+            shutil.copy('LinkedCapacities.mat', path.join(folder, 'b.mat'))
+            shutil.copy('LinkedCapacities_A.mat', path.join(folder, 'c.mat'))
+            
+            simdex = Simdex(h5='simdex_first.h5')
+            simdex.scan(folder=folder)
+            self.assertEqual(sorted(simdex.get_filenames()), 
+                             ['b.mat', 'c.mat'])
+            time = Simulation('LinkedCapacities').get_value('Time')
+            self.assertEqual(simdex.simulationstop, time[-1])
+            remove(simdex.h5_path)
+        finally:
+            shutil.rmtree(folder)
+
+    def test_scan_again_timecheck(self):
+        """A second scan checks the time range, unless timecheck=False"""
+        
+        import tempfile, shutil
+        folder = tempfile.mkdtemp()
+        try:
+            shutil.copy(
+                'SubfolderWithCrappyFiles/LinkedCapacities_D_TooShort.mat', 
+                folder)
+            n = len(self.simdex.simulations)
+            self.simdex.scan(folder=folder)
+            self.assertEqual(len(self.simdex.simulations), n)
+            self.simdex.scan(folder=folder, timecheck=False)
+            self.assertEqual(len(self.simdex.simulations), n + 1)
+        finally:
+            shutil.rmtree(folder)
+
+    def test_remove(self):
+        """Removing a simulation from the simdex and the h5 file"""
+        
+        sid = self.simdex.simulations[0]
+        self.simdex.remove(sid)
+        self.assertFalse(sid in self.simdex.simulations)
+        self.assertFalse(self.simdex.files.has_key(sid))
+        self.assertEqual(self.simdex.variablemap.shape[1], 
+                         len(self.simdex.simulations))
+        # Array.mat was the only simulation with arrays
+        self.assertFalse('c[1].T' in self.simdex.variables)
+        self.assertFalse('c[1].C' in self.simdex.parameters)
+        self.assertEqual(self.simdex.get('c1.T').val.has_key(sid), False)
+        self.assertRaises(ValueError, self.simdex.remove, sid)
+
+    def test_scan_aliases(self):
+        """Aliases are stored as links, with the opposite sign in _neg"""
+        
+        sim = Simulation('LinkedCapacities.mat')
+        sid = [k for k, v in self.simdex.files.items() if 
+               v == sim.filename][0]
+        for name in ['c1.heatPort.Q_flow', 'c2.heatPort.Q_flow', 
+                     'r.heatPort_b.T']:
+            np.testing.assert_equal(self.simdex.get(name).val[sid], 
+                                    sim.get_value(name))
+        self.simdex.openh5()
+        arrays = [n for n in self.simdex.h5.walkNodes('/' + sid, 'Array')]
+        negatives = [n._v_name for n in 
+                     self.simdex.h5.listNodes('/' + sid + '/_neg')]
+        self.simdex.h5.close()
+        self.assertEqual(len(arrays), len(sim.variables))
+        self.assertEqual(sorted(negatives), 
+                         ['c2_dot_heatPort_dot_Q_flow', 
+                          'r_dot_heatPort_a_dot_Q_flow'])
+
+    def test_format_version_2(self):
+        """Format 2 and a converted h5 file give the same trajectories"""
+        
+        simdex = Simdex(h5='simdex_v2.h5', format_version=2)
+        simdex.scan()
+        self.simdex.convert_h5('simdex_converted.h5')
+        for simdex_2 in [simdex, self.simdex]:
+            simdex_2.openh5()
+            self.assertEqual(simdex_2.h5.root._v_attrs.format_version, 2)
+            simdex_2.h5.close()
+        reference = Simdex(h5='simdex_v1.h5')
+        reference.scan()
+        for name in ['Time', 'c1.T', 'c2.heatPort.Q_flow', 'r.heatPort_b.T']:
+            expected = reference.get(name).val
+            for simdex_2 in [simdex, self.simdex]:
+                values = simdex_2.get(name).val
+                self.assertEqual(sorted(values.keys()), sorted(expected.keys()))
+                for sid in expected:
+                    np.testing.assert_array_equal(values[sid], expected[sid])
+        
+        sid = simdex.simulations[0]
+        simdex.remove(sid)
+        self.assertFalse(simdex.get('Time').val.has_key(sid))
+        
+        # format 2 to format 2 leaves out the removed simulation
+        expected = dict([(name, simdex.get(name).val) 
+                         for name in ['Time', 'c1.T', 'r.heatPort_b.T']])
+        v2_path = simdex.h5_path
+        simdex.convert_h5('simdex_converted_2.h5')
+        for name, values in expected.items():
+            converted = simdex.get(name).val
+            self.assertEqual(sorted(converted.keys()), sorted(values.keys()))
+            for key in values:
+                np.testing.assert_array_equal(converted[key], values[key])
+        
+        # names that do not fit in the offsets tables are refused
+        from awesim.simdex import _write_arrays
+        simdex.openh5()
+        self.assertRaises(ValueError, _write_arrays, simdex.h5,
+                          'SID9999', [('a' * 256, np.zeros(3), None, [])])
+        simdex.h5.close()
+        for simdex_2 in [simdex, reference, self.simdex]:
+            remove(simdex_2.h5_path)
+        remove(v2_path)
+
+    def test_read_variable_sparse(self):
+        """Format 2: a sparse selection and the cached offsets tables"""
+        
+        simdex = Simdex(h5='simdex_v2.h5', format_version=2)
+        simdex.scan()
+        expected = simdex.get('c1.T').val
+        selection = sorted(expected.keys())[::2]
+        temp, = simdex._get_vars_h5(['c1.T'], selection)
+        self.assertEqual(sorted(temp.keys()), sorted(selection))
+        for sid in selection:
+            np.testing.assert_array_equal(temp[sid], expected[sid])
+        self.assertTrue(('/offsets', 'c1_dot_T') in simdex.cache)
+        
+        # the cached offsets table is dropped when it changes
+        simdex.remove(selection[0])
+        self.assertFalse(('/offsets', 'c1_dot_T') in simdex.cache)
+        values = simdex.get('c1.T').val
+        self.assertFalse(values.has_key(selection[0]))
+        for sid in values:
+            np.testing.assert_array_equal(values[sid], expected[sid])
+        remove(simdex.h5_path)
+
+    def test_scan_blobs(self):
+        """Identical arrays of different simulations are stored once"""
+        
+        self.simdex.openh5()
+        digests = [self.simdex.h5.getNode('/' + sid, 'Time').attrs.digest 
+                   for sid in self.simdex.simulations]
+        self.simdex.h5.close()
+        self.assertTrue(len(set(digests)) < len(digests))
+        
+        # a blob is removed with the last simulation that links to it
+        times = self.simdex.get('Time').val
+        last = self.simdex.simulations[-1]
+        for sid in self.simdex.simulations[:-1]:
+            self.simdex.remove(sid)
+        np.testing.assert_array_equal(self.simdex.get('Time').val[last], 
+                                      times[last])
+        self.simdex.remove(self.simdex.simulations[0])
+        self.simdex.openh5()
+        self.assertEqual(self.simdex.h5.listNodes('/_blobs'), [])
+        self.simdex.h5.close()
+
+    def test_get_vars_h5(self):
+        """Only the selected simulations are read, in a single pass"""
+        
+        selection = self.simdex.simulations[2:4]
+        temp, time = self.simdex._get_vars_h5(['c1.T', 'Time'], 
+                                              selection + ['SID9999'])
+        self.assertEqual(sorted(temp.keys()), selection)
+        self.assertEqual(sorted(time.keys()), selection)
+        expected = self.simdex.get('c1.T').val
+        for sid in selection:
+            np.testing.assert_array_equal(temp[sid], expected[sid])
+        self.assertEqual(self.simdex._get_vars_h5(['nonexisting'], 
+                                                  selection), [{}])
+
+    def test_cache(self):
+        """Trajectories are read once, and kept within the memory budget"""
+        
+        cache = self.simdex.cache
+        first = self.simdex.get('c1.T').val
+        misses = cache.misses
+        second = self.simdex.get('c1.T').val
+        self.assertEqual(cache.misses, misses)
+        self.assertEqual(cache.hits, 2 * len(self.simdex.simulations))
+        for sid in first:
+            self.assertFalse(second[sid] is first[sid])
+            np.testing.assert_array_equal(second[sid], first[sid])
+        
+        # filtered simdexes share the cache
+        filtered = self.simdex.filter_selection(self.simdex.simulations[:2])
+        self.assertTrue(filtered.cache is cache)
+        
+        sid = self.simdex.simulations[0]
+        self.simdex.remove(sid)
+        self.assertFalse((sid, 'c1_dot_T') in cache)
+        
+        cache.maxbytes = cache.nbytes // 2
+        self.simdex.get('c2.T')
+        self.assertTrue(cache.nbytes <= cache.maxbytes)
+        self.assertTrue(cache.evictions > 0)
+        self.assertEqual(cache.stats()['entries'], len(cache))
+
+    def test_cache_modify(self):
+        """Changing a returned array does not change the cache"""
+        
+        res = self.simdex.get('c1.T')
+        sid = sorted(res.val.keys())[0]
+        expected = res.val[sid].copy()
+        res.val[sid] += 1.
+        res.val[sid][0] = 0.
+        np.testing.assert_array_equal(self.simdex.get('c1.T').val[sid], 
+                                      expected)
+        # an empty selection is all simulations of the simdex, cached too
+        hits = self.simdex.cache.hits
+        temp, = self.simdex._get_vars_h5(['c1.T'])
+        self.assertEqual(sorted(temp.keys()), sorted(res.val.keys()))
+        self.assertEqual(self.simdex.cache.hits, 
+                         hits + len(self.simdex.simulations))
+        np.testing.assert_array_equal(temp[sid], expected)
+
+    def test_scan_constants(self):
+        """Constant trajectories are stored as a single value"""
+        
+        self.simdex = Simdex()
+        self.simdex.scan(folder=path.join(self.cwd, 'TestSet2'))
+        sid = self.simdex.simulations[0]
+        sim = Simulation('./TestSet2/reswithCPUtime')
+        value = self.simdex.get('TOpSet[1].y').val[sid]
+        np.testing.assert_equal(value, sim.get_value('TOpSet[1].y'))
+        # also from the cache, a constant stays a read-only broadcast view
+        for value in [value, self.simdex.get('TOpSet[1].y').val[sid]]:
+            self.assertEqual(value.strides, (0,))
+            self.assertFalse(value.flags.writeable)
+        self.simdex.openh5()
+        node = self.simdex.h5.getNode('/' + sid, 'TOpSet[1]_dot_y')
+        self.assertEqual(node.shape, (1,))
+        self.simdex.h5.close()
+        
+    def test_scan_constants_pp(self):
+        """A pp line that overwrites a constant variable is stored in full"""
+        
+        process = Process(variables={'y': 'TOpSet[1].y'}, 
+                          pp=['y = y + Time'])
+        self.simdex = Simdex()
+        self.simdex.scan(folder=path.join(self.cwd, 'TestSet2'), 
+                         process=process)
+        sid = self.simdex.simulations[0]
+        sim = Simulation('./TestSet2/reswithCPUtime')
+        expected = sim.get_value('TOpSet[1].y') + sim.get_value('Time')
+        np.testing.assert_array_equal(self.simdex.get('y').val[sid], 
+                                      expected)
+        
+    def test_scan_grid(self):
+        """All trajectories are resampled to the grid while indexing"""
+        
+        grid = np.linspace(0, 20000, 11)
+        self.simdex = Simdex()
+        self.simdex.scan(grid=grid)
+        time = self.simdex.get('Time')
+        temp = self.simdex.get('c1.T')
+        for sid in self.simdex.simulations:
+            np.testing.assert_array_almost_equal(time.val[sid], grid)
+        for sid, trajectory in temp.val.items():
+            self.assertEqual(len(trajectory), len(grid))
+
+    def test_analyse_cputime(self):
+        """Correlations with cputime over all simulations, in a table"""
+
+        self.simdex.scan(folder=path.join(self.cwd, 'TestSet2'),
+                         timecheck=False)
+        table = self.simdex.analyse_cputime(interval=1000, screendump=0,
+                                            workers=2)
+        corr = Simulation('./TestSet2/reswithCPUtime').analyse_cputime(
+            interval=1000, screendump=0)
+        self.assertEqual(list(table.columns), ['mean', 'std', 'count'])
+        self.assertEqual(table.index[0], 'CPUtime')
+        self.assertTrue(np.all(table['count'] == 1))
+        for name in table.index:
+            self.assertAlmostEqual(table.loc[name, 'mean'], corr[name], 12)
+
+    def test_analyse_cputime_files(self):
+        """Equal correlations have a zero std, unreadable files are skipped"""
+        
+        import tempfile, shutil
+        folder = tempfile.mkdtemp()
+        try:
+            for name in ['a.mat', 'b.mat', 'c.mat']:
+                shutil.copy('TestSet2/reswithCPUtime.mat', 
+                            path.join(folder, name))
+            simdex = Simdex()
+            simdex.scan(folder=folder)
+            remove(path.join(folder, 'c.mat'))
+            table = simdex.analyse_cputime(interval=1000, screendump=0)
+            self.assertTrue(np.all(table['count'] == 2))
+            self.assertTrue(np.all(table['std'] == 0))
+        finally:
+            shutil.rmtree(folder)
+
 
     def test_exist(self):
         """
@@ -1234,6 +2091,37 @@ class UtilitiesTest(unittest.TestCase):
         ag = aggregate_by_time(signal, time, period, interval)
         ag = ag.reshape(2,)
         np.testing.assert_array_equal(ag, np.array([2.   ,  3.125]))
+
+    def test_spearman_columns(self):
+        """Vectorized rank correlation should equal spearmanr per column"""
+        
+        from scipy.stats import spearmanr
+        rs = np.random.RandomState(0)
+        a = rs.randint(0, 5, (40, 4)).astype(float)
+        a[:, 1] = 3.
+        b = rs.randint(0, 7, 40).astype(float)
+        corr = spearman_columns(a, b)
+        self.assertTrue(np.isnan(corr[1]))
+        for i in [0, 2, 3]:
+            self.assertAlmostEqual(corr[i], spearmanr(a[:, i], b)[0], 12)
+
+    def test_resample(self):
+        """Resampling with events, splines and extrapolation"""
+        
+        time = np.array([0., 1., 2., 2., 3.])
+        values = np.array([0., 1., 2., 5., 6.])
+        grid = np.array([-1., 0.5, 2., 2.5, 4.])
+        np.testing.assert_array_almost_equal(
+            resample(time, values, grid), [0., 0.5, 5., 5.5, 6.])
+        lin = resample(time, values, grid, extrapolation=1)
+        np.testing.assert_array_almost_equal(lin[[0, -1]], [-1., 7.])
+        self.assertTrue(np.isnan(resample(time, values, grid, 
+                                          extrapolation=-1)[[0, -1]]).all())
+        # a spline passes through all points, after the event
+        spline = resample(time, values, time, interpolation=1)
+        np.testing.assert_array_almost_equal(spline, [0., 1., 5., 5., 6.])
+        two_d = resample(time, np.column_stack([values, 2*values]), grid)
+        np.testing.assert_array_almost_equal(two_d[:, 1], 2*two_d[:, 0])
         
  
 
@@ -1241,15 +2129,19 @@ class UtilitiesTest(unittest.TestCase):
 #    unittest.main()
 
 
-suite1 = unittest.TestLoader().loadTestsFromTestCase(ProcessTest)
-suite2 = unittest.TestLoader().loadTestsFromTestCase(ResultTest)
-suite3 = unittest.TestLoader().loadTestsFromTestCase(SimulationTest)
-suite4 = unittest.TestLoader().loadTestsFromTestCase(SimdexTest)
-suite5 = unittest.TestLoader().loadTestsFromTestCase(UtilitiesTest)
-
-
-alltests = unittest.TestSuite([suite1, suite2, suite3, suite4, suite5])
-
-#unittest.TextTestRunner(verbosity=1, failfast=False).run(alltests)
-unittest.TextTestRunner(verbosity=1).run(alltests)
+# the suite is only run as a script, not when the module is imported: the
+# tests with workers need a process pool, which cannot be used during an 
+# import
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(ProcessTest)
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(ResultTest)
+    suite3 = unittest.TestLoader().loadTestsFromTestCase(SimulationTest)
+    suite4 = unittest.TestLoader().loadTestsFromTestCase(SimdexTest)
+    suite5 = unittest.TestLoader().loadTestsFromTestCase(UtilitiesTest)
+    
+    
+    alltests = unittest.TestSuite([suite1, suite2, suite3, suite4, suite5])
+    
+    #unittest.TextTestRunner(verbosity=1, failfast=False).run(alltests)
+    unittest.TextTestRunner(verbosity=1).run(alltests)
 